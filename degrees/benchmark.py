@@ -0,0 +1,265 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from array import array
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Ways of loading and searching the data, by name:
+# keyword arguments for load_data and the search function to time
+CONFIGURATIONS = {
+    "bfs": ({}, "shortest_path"),
+    "bidirectional": ({}, "bidirectional_shortest_path"),
+    "compact-bfs": ({"compact": True}, "shortest_path"),
+    "compact-bidirectional": (
+        {"compact": True}, "bidirectional_shortest_path"
+    ),
+    "compact-alt": ({"compact": True}, "alt_shortest_path")
+}
+
+SYLLABLES = [
+    "al", "an", "ar", "be", "bo", "da", "el", "en", "fi", "ga", "ha", "is",
+    "ja", "ka", "la", "le", "li", "ma", "mi", "na", "no", "ra", "ri", "ro",
+    "sa", "se", "ta", "to", "va", "vi", "wa", "ya", "ze", "zo"
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark degrees on a synthetic scale-free dataset."
+    )
+    parser.add_argument("directory",
+                        help="dataset directory, generated if missing")
+    parser.add_argument("--people", type=int, default=10 ** 4,
+                        help="number of people to generate")
+    parser.add_argument("--queries", type=int, default=100,
+                        help="number of source/target pairs to time")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--configurations", nargs="+",
+                        choices=list(CONFIGURATIONS),
+                        default=list(CONFIGURATIONS))
+    parser.add_argument("--save", metavar="FILE",
+                        help="write the results to FILE as JSON")
+    parser.add_argument("--baseline", metavar="FILE",
+                        help="compare against results saved with --save")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown against the baseline")
+    args = parser.parse_args()
+
+    if not os.path.exists(os.path.join(args.directory, "stars.csv")):
+        print(f"Generating {args.people} people in {args.directory}...")
+        generate(args.directory, args.people, args.seed)
+
+    queries = pick_queries(args.directory, args.queries, args.seed)
+
+    results = {}
+    for name in args.configurations:
+        results[name] = run_isolated(args.directory, name, queries)
+        print_result(name, results[name])
+
+    lengths = {name: result["lengths"] for name, result in results.items()}
+    disagree = len(set(map(tuple, lengths.values()))) > 1
+    if disagree:
+        print("Disagreement: configurations found paths of different lengths")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+
+    if disagree or regressions:
+        sys.exit(1)
+
+
+def generate(directory, n, seed=0):
+    """
+    Write people.csv, movies.csv and stars.csv for `n` people into
+    `directory`, with about n / 2 movies of 1 to 8 stars each.
+
+    Stars are chosen by preferential attachment: most of the time a
+    star is someone picked in proportion to how many movies they have
+    already been in, so the number of movies per person follows a
+    power law with a few prolific hub actors, as in the IMDb data.
+    """
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+
+    with open(os.path.join(directory, "people.csv"), "w",
+              encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "name", "birth"])
+        for person in range(n):
+            writer.writerow([person, _random_name(rng),
+                             rng.randint(1920, 2005)])
+
+    # every entry is one appearance, so a uniform pick from it
+    # is proportional to the number of movies of each person
+    appearances = array("i")
+    with open(os.path.join(directory, "movies.csv"), "w",
+              encoding="utf-8", newline="") as movies_file, \
+            open(os.path.join(directory, "stars.csv"), "w",
+                 encoding="utf-8", newline="") as stars_file:
+        movies_writer = csv.writer(movies_file)
+        stars_writer = csv.writer(stars_file)
+        movies_writer.writerow(["id", "title", "year"])
+        stars_writer.writerow(["person_id", "movie_id"])
+
+        for movie in range(max(n // 2, 1)):
+            movies_writer.writerow([movie, _random_name(rng).title(),
+                                    rng.randint(1930, 2020)])
+            cast = set()
+            for _ in range(rng.randint(1, 8)):
+                if appearances and rng.random() < 0.8:
+                    cast.add(appearances[rng.randrange(len(appearances))])
+                else:
+                    cast.add(rng.randrange(n))
+            for person in cast:
+                appearances.append(person)
+                stars_writer.writerow([person, movie])
+
+
+def _random_name(rng):
+    return " ".join(
+        "".join(rng.choices(SYLLABLES, k=rng.randint(1, 3))).capitalize()
+        for _ in range(2)
+    )
+
+
+def pick_queries(directory, count, seed=0):
+    """
+    Returns `count` random pairs of person ids that appear in stars.csv,
+    the same for every configuration and run with the same seed.
+    """
+    linked = set()
+    with open(os.path.join(directory, "stars.csv"), encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader)
+        for person_id, _ in reader:
+            linked.add(person_id)
+    linked = sorted(linked)
+
+    rng = random.Random(seed)
+    return [
+        (rng.choice(linked), rng.choice(linked)) for _ in range(count)
+    ]
+
+
+def run_isolated(directory, name, queries):
+    """
+    Runs one configuration in a fresh process,
+    so that its load time and peak memory are its own.
+    """
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1) as pool:
+        return pool.apply(run, (directory, name, queries))
+
+
+def run(directory, name, queries):
+    """
+    Loads the data and times every query with one configuration.
+    """
+    import degrees
+
+    load_kwargs, search_name = CONFIGURATIONS[name]
+    search = getattr(degrees, search_name)
+
+    start = time.perf_counter()
+    degrees.load_data(directory, **load_kwargs)
+    if search_name == "alt_shortest_path":
+        degrees.build_landmarks()
+    load_time = time.perf_counter() - start
+
+    latencies = []
+    explored = []
+    lengths = []
+    for source, target in queries:
+        start = time.perf_counter()
+        path = search(source, target)
+        latencies.append(time.perf_counter() - start)
+        explored.append(degrees.search_stats["explored"])
+        lengths.append(None if path is None else len(path))
+
+    latencies.sort()
+    return {
+        "load_seconds": load_time,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p90_ms": percentile(latencies, 90) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_explored": sum(explored) / len(explored) if explored else 0,
+        "peak_rss_mb": peak_rss_mb(),
+        "lengths": lengths
+    }
+
+
+def percentile(values, p):
+    """
+    Returns the p-th percentile of sorted `values` (nearest rank).
+    """
+    if not values:
+        return 0
+    rank = max(int(round(p / 100 * len(values))) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def peak_rss_mb():
+    """
+    Returns the peak resident memory of this process in megabytes,
+    or None where the resource module is not available.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is in kilobytes, except on macOS where it is in bytes
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def print_result(name, result):
+    memory = result["peak_rss_mb"]
+    print(f"{name}:")
+    print(f"  load: {result['load_seconds']:.2f}s")
+    print(f"  latency: p50 {result['p50_ms']:.2f}ms, "
+          f"p90 {result['p90_ms']:.2f}ms, p99 {result['p99_ms']:.2f}ms")
+    print(f"  explored: {result['mean_explored']:.1f} people per query")
+    if memory is not None:
+        print(f"  peak memory: {memory:.1f} MB")
+
+
+def compare(baseline, results, tolerance):
+    """
+    Returns descriptions of the configurations that are slower than
+    `baseline` by more than `tolerance`, or find paths of other lengths.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]
+        for key in ("load_seconds", "p50_ms", "p90_ms"):
+            if result[key] > before[key] * (1 + tolerance):
+                regressions.append(
+                    f"{name} {key} {before[key]:.2f} -> {result[key]:.2f}"
+                )
+        if result["lengths"] != before["lengths"]:
+            regressions.append(f"{name} found paths of different lengths")
+    return regressions
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,36 @@
+import argparse
 import csv
+import functools
+import json
+import multiprocessing
+import operator
+import os
+import pickle
+import socketserver
+import stat
 import sys
+import threading
+import time
 
-from util import Node, StackFrontier, QueueFrontier
+from array import array
+
+from graph import Distances, Graph, Landmarks
+from nameindex import NameIndex
+from util import Node, DequeQueueFrontier
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Directory, inside the data directory, holding the compiled snapshot
+CACHE_DIRECTORY = ".degrees-cache"
+
+# Default number of landmarks used by alt_shortest_path
+LANDMARKS = 8
+
+# Default number of people whose neighbors are kept by neighbors_for_person
+NEIGHBOR_CACHE_SIZE = 4096
 
 # Maps names to a set of corresponding person_ids
 names = {}
@@ -12,11 +41,65 @@ people = {}
 # Maps movie_ids to a dictionary of: title, year, stars (a set of person_ids)
 movies = {}
 
+# Sorted index over names for prefix and fuzzy lookup, built on first use
+name_index = None
+
+# Compact integer-indexed star graph, set when loading with compact=True
+graph = None
+
+# Rows and seconds per CSV file of the most recent streaming load
+load_stats = {}
+
+# Landmark distances used by alt_shortest_path, built on first use
+landmarks = None
 
-def load_data(directory):
+# Statistics about the most recent search
+search_stats = {"explored": 0}
+
+# Serializes queries answered by the server, which share search_stats
+query_lock = threading.Lock()
+
+# Graph attached to shared memory in each worker process of a parallel batch
+worker_graph = None
+
+
+def load_data(directory, compact=False, cache=False, linked_only=False):
     """
     Load data from CSV files into memory.
+
+    With `compact`, people and movies keep only their names and titles,
+    and the stars are stored in the integer-indexed `graph` instead of
+    sets of ids. The CSV files are then streamed with plain csv readers,
+    and `linked_only` also drops people and movies without any stars.
+
+    With `cache`, the compact data is also written to a snapshot inside
+    `directory` on first load, and later loads memory-map that snapshot
+    for as long as the CSV files are unchanged.
+
+    The name index is built on the first lookup that needs it, except
+    with `cache`, where it is built up front and kept in the snapshot.
     """
+    global graph, name_index, landmarks
+    graph = None
+    name_index = None
+    landmarks = None
+    names.clear()
+    people.clear()
+    movies.clear()
+    load_stats.clear()
+    _cached_neighbors.cache_clear()
+
+    if cache:
+        if _load_snapshot(directory, linked_only):
+            return
+        compact = True
+
+    if compact or linked_only:
+        graph = _stream_data(directory, linked_only)
+        if cache:
+            _save_snapshot(directory, linked_only)
+        return
+
     # Load people
     with open(f"{directory}/people.csv", encoding="utf-8") as f:
         reader = csv.DictReader(f)
@@ -52,24 +135,327 @@ def load_data(directory):
                 pass
 
 
+def _stream_data(directory, linked_only):
+    """
+    Stream the CSV files into people, movies, names and a compact graph,
+    recording the rows per second of each file and the peak memory
+    in `load_stats`.
+    """
+    person_index = {}
+    for person_id, name, birth in _read_csv(
+        directory, "people.csv", "id", "name", "birth"
+    ):
+        person_index.setdefault(person_id, len(person_index))
+        people[person_id] = {"name": name, "birth": birth}
+
+    movie_index = {}
+    for movie_id, title, year in _read_csv(
+        directory, "movies.csv", "id", "title", "year"
+    ):
+        movie_index.setdefault(movie_id, len(movie_index))
+        movies[movie_id] = {"title": title, "year": year}
+
+    star_people = array("i")
+    star_movies = array("i")
+    for person_id, movie_id in _read_csv(
+        directory, "stars.csv", "person_id", "movie_id"
+    ):
+        try:
+            person = person_index[person_id]
+            movie = movie_index[movie_id]
+        except KeyError:
+            continue
+        star_people.append(person)
+        star_movies.append(movie)
+
+    # the graph rows follow the numbering of the indexes
+    person_ids = list(person_index)
+    movie_ids = list(movie_index)
+    del person_index, movie_index
+    if linked_only:
+        person_ids = _drop_unlinked(people, person_ids, star_people)
+        movie_ids = _drop_unlinked(movies, movie_ids, star_movies)
+
+    for person_id, person in people.items():
+        name = person["name"].lower()
+        if name not in names:
+            names[name] = {person_id}
+        else:
+            names[name].add(person_id)
+
+    loaded = Graph.from_stars(person_ids, movie_ids, star_people, star_movies)
+    if resource is not None:
+        # ru_maxrss is in kilobytes, except on macOS where it is in bytes
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        load_stats["peak_rss_mb"] = (
+            peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+        )
+    return loaded
+
+
+def _read_csv(directory, filename, *columns):
+    """
+    Yields the given columns of every row of a CSV file as a tuple,
+    then records how many rows were read and how long it took
+    in `load_stats`.
+    """
+    start = time.perf_counter()
+    count = 0
+    with open(os.path.join(directory, filename),
+              encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        get = operator.itemgetter(*map(header.index, columns))
+        for row in reader:
+            count += 1
+            yield get(row)
+    seconds = time.perf_counter() - start
+    load_stats[filename] = {
+        "rows": count,
+        "seconds": seconds,
+        "rows_per_second": count / seconds if seconds else 0
+    }
+
+
+def _drop_unlinked(table, ids, links):
+    """
+    Deletes from `table` the ids whose index never appears in `links`,
+    renumbers `links` in place for the remaining ids and returns them.
+    """
+    linked = bytearray(len(ids))
+    for i in links:
+        linked[i] = 1
+
+    renumber = array("i", [-1]) * len(ids)
+    kept = []
+    for i, key in enumerate(ids):
+        if linked[i]:
+            renumber[i] = len(kept)
+            kept.append(key)
+        else:
+            del table[key]
+
+    for position, i in enumerate(links):
+        links[position] = renumber[i]
+    return kept
+
+
+def _source_stamps(directory):
+    """
+    Returns the modification time and size of each CSV file,
+    which identify the data a snapshot was compiled from.
+    """
+    stamps = {}
+    for filename in ("people.csv", "movies.csv", "stars.csv"):
+        stat = os.stat(os.path.join(directory, filename))
+        stamps[filename] = [stat.st_mtime_ns, stat.st_size]
+    return stamps
+
+
+def _save_snapshot(directory, linked_only):
+    """
+    Write the loaded people, movies, names, name index and graph into
+    the snapshot directory, building the name index first. A snapshot
+    that cannot be written is skipped.
+    """
+    path = os.path.join(directory, CACHE_DIRECTORY)
+    manifest = os.path.join(path, "manifest.json")
+    try:
+        os.makedirs(path, exist_ok=True)
+
+        # the manifest is written last, so a partial snapshot is never used
+        if os.path.exists(manifest):
+            os.remove(manifest)
+
+        graph.save(path)
+        with open(os.path.join(path, "tables.pickle"), "wb") as f:
+            pickle.dump(
+                (people, movies, names, get_name_index(),
+                 graph.person_ids, graph.movie_ids),
+                f, pickle.HIGHEST_PROTOCOL
+            )
+        with open(manifest, "w") as f:
+            json.dump({
+                "sources": _source_stamps(directory),
+                "linked_only": linked_only
+            }, f)
+    except OSError:
+        pass
+
+
+def _load_snapshot(directory, linked_only):
+    """
+    Load people, movies, names, the name index and a memory-mapped
+    graph from the snapshot directory. Returns False if there is no
+    snapshot, the CSV files have changed since it was written or it was
+    written with a different `linked_only`.
+    """
+    global graph, name_index
+
+    path = os.path.join(directory, CACHE_DIRECTORY)
+    try:
+        with open(os.path.join(path, "manifest.json")) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if manifest.get("sources") != _source_stamps(directory):
+        return False
+    if manifest.get("linked_only") != linked_only:
+        return False
+
+    # a snapshot with missing or damaged files is rebuilt
+    try:
+        with open(os.path.join(path, "tables.pickle"), "rb") as f:
+            tables = pickle.load(f)
+        (saved_people, saved_movies, saved_names, saved_index,
+         person_ids, movie_ids) = tables
+        loaded = Graph.load(path, person_ids, movie_ids)
+    except (OSError, EOFError, ValueError, TypeError,
+            pickle.UnpicklingError):
+        return False
+    people.update(saved_people)
+    movies.update(saved_movies)
+    names.update(saved_names)
+
+    graph = loaded
+    name_index = saved_index
+    return True
+
+
 def main():
-    if len(sys.argv) > 2:
-        sys.exit("Usage: python degrees.py [directory]")
-    directory = sys.argv[1] if len(sys.argv) == 2 else "large"
+    parser = argparse.ArgumentParser(
+        description="Find the degrees of separation between two actors."
+    )
+    parser.add_argument("directory", nargs="?", default="large")
+    parser.add_argument("--bidirectional", action="store_true",
+                        help="search from both source and target at once")
+    parser.add_argument("--alt", action="store_true",
+                        help="search with A* and landmark distance bounds")
+    parser.add_argument("--landmarks", metavar="FILE",
+                        help="load the landmarks for --alt from FILE, "
+                             "or save them there if it does not exist")
+    parser.add_argument("--stats", action="store_true",
+                        help="print the number of states explored")
+    parser.add_argument("--compact", action="store_true",
+                        help="store the star graph as integer arrays")
+    parser.add_argument("--cache", action="store_true",
+                        help="load from (and save) a compiled snapshot")
+    parser.add_argument("--linked-only", action="store_true",
+                        help="skip people and movies without any stars")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--batch", metavar="FILE",
+                      help="answer the queries in FILE ('-' for stdin) "
+                           "as JSON lines")
+    mode.add_argument("--serve", metavar="ADDRESS",
+                      help="answer queries on HOST:PORT or a Unix socket path")
+    mode.add_argument("--precompute", metavar="FILE",
+                      help="save the distances from one person to everyone "
+                           "to FILE")
+    mode.add_argument("--distances", metavar="FILE",
+                      help="look up paths from the person saved in FILE "
+                           "with --precompute")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes answering batch queries")
+    parser.add_argument("--neighbor-cache", type=int,
+                        default=NEIGHBOR_CACHE_SIZE, metavar="SIZE",
+                        help="number of people whose neighbors are cached")
+    args = parser.parse_args()
+    if args.workers > 1 and not args.batch:
+        parser.error("--workers requires --batch")
+    if args.landmarks and not args.alt:
+        parser.error("--landmarks requires --alt")
+    if args.serve:
+        host, colon, port = args.serve.rpartition(":")
+        if colon and "/" not in args.serve and not port.isdigit():
+            parser.error(f"--serve {args.serve}: port must be a number")
+        if (not port.isdigit() and os.path.exists(args.serve)
+                and not stat.S_ISSOCK(os.stat(args.serve).st_mode)):
+            parser.error(f"--serve {args.serve}: exists and is not a socket")
+
+    # Progress goes to stderr when stdout carries JSON lines
+    log = sys.stderr if args.batch or args.serve else sys.stdout
+
+    set_neighbor_cache_size(args.neighbor_cache)
 
     # Load data from files into memory
-    print("Loading data...")
-    load_data(directory)
-    print("Data loaded.")
+    print("Loading data...", file=log)
+    compact = (args.compact or args.workers > 1 or args.alt
+               or args.precompute or args.distances)
+    load_data(args.directory, compact=compact, cache=args.cache,
+              linked_only=args.linked_only)
+    print("Data loaded.", file=log)
+    if args.stats:
+        print_load_stats(log)
+
+    # The server builds the name index before taking any queries
+    if args.serve:
+        get_name_index()
+
+    if args.alt:
+        try:
+            build_landmarks(filename=args.landmarks)
+        except ValueError as error:
+            sys.exit(str(error))
+
+    if args.batch:
+        if args.batch == "-":
+            infile = sys.stdin
+        else:
+            infile = open(args.batch, encoding="utf-8")
+        with infile:
+            if args.workers > 1:
+                run_parallel_batch(infile, sys.stdout, args.workers,
+                                   args.bidirectional, args.alt)
+            else:
+                run_batch(infile, sys.stdout, args.bidirectional, args.alt)
+        if args.stats:
+            print_neighbor_cache_stats(log)
+        return
+
+    if args.serve:
+        print(f"Serving on {args.serve}", file=log)
+        try:
+            serve(args.serve, args.bidirectional, args.alt)
+        except ValueError as error:
+            sys.exit(str(error))
+        if args.stats:
+            print_neighbor_cache_stats(log)
+        return
+
+    if args.distances:
+        try:
+            distances = load_distances(args.distances)
+        except ValueError as error:
+            sys.exit(str(error))
+        source = graph.person_ids[distances.source]
+        print(f"Distances from {people[source]['name']}.")
+    else:
+        source = person_id_for_name(input("Name: "))
+        if source is None:
+            sys.exit("Person not found.")
+
+    if args.precompute:
+        precompute_distances(source, args.precompute)
+        print(f"{search_stats['explored']} people reached, "
+              f"saved to {args.precompute}.")
+        return
 
-    source = person_id_for_name(input("Name: "))
-    if source is None:
-        sys.exit("Person not found.")
     target = person_id_for_name(input("Name: "))
     if target is None:
         sys.exit("Person not found.")
 
-    path = shortest_path(source, target)
+    if args.distances:
+        path = path_to(distances, target)
+    elif args.alt:
+        path = alt_shortest_path(source, target)
+    elif args.bidirectional:
+        path = bidirectional_shortest_path(source, target)
+    else:
+        path = shortest_path(source, target)
+
+    if args.stats:
+        print(f"{search_stats['explored']} states explored.")
+        print_neighbor_cache_stats()
 
     if path is None:
         print("Not connected.")
@@ -84,6 +470,29 @@ def main():
             print(f"{i + 1}: {person1} and {person2} starred in {movie}")
 
 
+def print_load_stats(file=sys.stdout):
+    """
+    Prints the rows per second of each CSV file and the peak memory
+    of the most recent streaming load, if any.
+    """
+    for filename, stats in load_stats.items():
+        if filename.endswith(".csv"):
+            print(f"{filename}: {stats['rows']} rows in "
+                  f"{stats['seconds']:.2f}s "
+                  f"({stats['rows_per_second']:.0f} rows/s)", file=file)
+    if "peak_rss_mb" in load_stats:
+        print(f"Peak memory: {load_stats['peak_rss_mb']:.1f} MB", file=file)
+
+
+def print_neighbor_cache_stats(file=sys.stdout):
+    """
+    Prints the hits and misses of the neighbor cache so far.
+    """
+    info = neighbor_cache_info()
+    print(f"Neighbor cache: {info.hits} hits, {info.misses} misses.",
+          file=file)
+
+
 def shortest_path(source, target):
     """
     Returns the shortest list of (movie_id, person_id) pairs
@@ -92,14 +501,25 @@ def shortest_path(source, target):
     If no possible path, returns None.
     """
 
+    if graph is not None:
+        path = graph.shortest_path(
+            graph.person_index[source], graph.person_index[target]
+        )
+        search_stats["explored"] = graph.explored
+        return graph.path_ids(path)
+
     # TODO
 
     #keep a count of states explored
     
     exploredCount = 0
 
+    if source == target:
+        search_stats["explored"] = exploredCount
+        return []
+
     start = Node(state = source, parent = None, action = None)
-    queue = QueueFrontier()
+    queue = DequeQueueFrontier()
     queue.add(start)
 
     #set of explored states
@@ -111,12 +531,13 @@ def shortest_path(source, target):
         #if frontier is empty, then no path exists
 
         if queue.empty():
+            search_stats["explored"] = exploredCount
             return None
 
         #else remove a node from the frontier and add to explored set
 
         node = queue.remove()
-        explored.add(node)
+        explored.add(node.state)
         exploredCount += 1
 
         #find the neighbors of the actor in node
@@ -138,48 +559,523 @@ def shortest_path(source, target):
                         node = node.parent
 
                     path.reverse()
+                    search_stats["explored"] = exploredCount
                     return path
 
                 queue.add(child)
-        
+
+
+def bidirectional_shortest_path(source, target):
+    """
+    Returns the shortest list of (movie_id, person_id) pairs
+    that connect the source to the target, growing one breadth-first
+    frontier from the source and another from the target until they meet.
+
+    If no possible path, returns None.
+    """
+
+    if graph is not None:
+        path = graph.bidirectional_shortest_path(
+            graph.person_index[source], graph.person_index[target]
+        )
+        search_stats["explored"] = graph.explored
+        return graph.path_ids(path)
+
+    search_stats["explored"] = 0
+
+    if source == target:
+        return []
+
+    # for each side, map every reached person to the (movie_id, person_id)
+    # step that leads back towards the side's starting person
+
+    forward = {source: None}
+    backward = {target: None}
+    forward_frontier = [source]
+    backward_frontier = [target]
+
+    while forward_frontier and backward_frontier:
+
+        # always expand the smaller frontier by one whole level
+
+        if len(forward_frontier) <= len(backward_frontier):
+            frontier, reached, other = forward_frontier, forward, backward
+        else:
+            frontier, reached, other = backward_frontier, backward, forward
+
+        next_frontier = []
+        meeting = None
+
+        for person in frontier:
+            search_stats["explored"] += 1
+
+            for movie, actor in neighbors_for_person(person):
+                if actor in reached:
+                    continue
+                reached[actor] = (movie, person)
+                next_frontier.append(actor)
+
+                # the first meeting point in a level is on a shortest path
+                if actor in other and meeting is None:
+                    meeting = actor
+
+        if meeting is not None:
+            return _join_paths(forward, backward, meeting)
+
+        if reached is forward:
+            forward_frontier = next_frontier
+        else:
+            backward_frontier = next_frontier
+
+    return None
+
+
+def alt_shortest_path(source, target):
+    """
+    Returns the shortest list of (movie_id, person_id) pairs
+    that connect the source to the target, using bidirectional A* search
+    over the compact graph with landmark distance bounds (ALT).
+
+    If no possible path, returns None.
+    """
+    if landmarks is None:
+        build_landmarks()
+    path = graph.alt_shortest_path(
+        graph.person_index[source], graph.person_index[target], landmarks
+    )
+    search_stats["explored"] = graph.explored
+    return graph.path_ids(path)
+
+
+def build_landmarks(count=LANDMARKS, filename=None):
+    """
+    Prepares the landmarks used by `alt_shortest_path`: the distances
+    from `count` people spread over the graph to everyone. With
+    `filename`, landmarks are loaded from that file if it exists,
+    and saved to it otherwise.
+
+    Raises ValueError if the file was computed for another dataset.
+    """
+    global landmarks
+    if filename is not None and os.path.exists(filename):
+        loaded = Landmarks.load(filename)
+        if loaded.fingerprint != graph.fingerprint():
+            raise ValueError(f"{filename} was computed for another dataset")
+        landmarks = loaded
+        return landmarks
+
+    landmarks = Landmarks.build(graph, count)
+    if filename is not None:
+        landmarks.save(filename)
+    return landmarks
+
+
+def _join_paths(forward, backward, meeting):
+    """
+    Builds the source to target path through `meeting` out of the
+    parent maps of a bidirectional search.
+    """
+    path = []
+
+    person = meeting
+    while forward[person] is not None:
+        movie, parent = forward[person]
+        path.append((movie, person))
+        person = parent
+    path.reverse()
+
+    person = meeting
+    while backward[person] is not None:
+        movie, child = backward[person]
+        path.append((movie, child))
+        person = child
+
+    return path
+
+
+def precompute_distances(source, filename):
+    """
+    Runs a single breadth-first search from the person with id `source`
+    over the compact graph and saves the distance and parent of every
+    person to `filename`. Returns the distances.
+    """
+    distances = graph.single_source(graph.person_index[source])
+    search_stats["explored"] = graph.explored
+    distances.save(filename)
+    return distances
+
+
+def load_distances(filename):
+    """
+    Loads distances saved by `precompute_distances` for the loaded graph.
+
+    Raises ValueError if the file was computed for another dataset.
+    """
+    distances = Distances.load(filename)
+    if distances.fingerprint != graph.fingerprint():
+        raise ValueError(f"{filename} was computed for another dataset")
+    return distances
+
+
+def path_to(distances, target):
+    """
+    Returns the shortest list of (movie_id, person_id) pairs that connect
+    the source of precomputed `distances` to the target, without searching.
+
+    If no possible path, returns None.
+    """
+    search_stats["explored"] = 0
+    return graph.path_ids(distances.path_to(graph.person_index[target]))
+
 
 def person_id_for_name(name):
     """
     Returns the IMDB id for a person's name,
-    resolving ambiguities as needed.
+    resolving ambiguities and typos as needed.
     """
     person_ids = list(names.get(name.lower(), set()))
     if len(person_ids) == 0:
-        return None
+        person_ids = get_name_index().suggest(name)
+        if len(person_ids) == 0:
+            return None
+        print(f"No one named '{name}'. Did you mean:")
     elif len(person_ids) > 1:
         print(f"Which '{name}'?")
-        for person_id in person_ids:
-            person = people[person_id]
-            name = person["name"]
-            birth = person["birth"]
-            print(f"ID: {person_id}, Name: {name}, Birth: {birth}")
-        try:
-            person_id = input("Intended Person ID: ")
-            if person_id in person_ids:
-                return person_id
-        except ValueError:
-            pass
-        return None
     else:
         return person_ids[0]
 
+    for person_id in person_ids:
+        person = people[person_id]
+        name = person["name"]
+        birth = person["birth"]
+        print(f"ID: {person_id}, Name: {name}, Birth: {birth}")
+    try:
+        person_id = input("Intended Person ID: ")
+        if person_id in person_ids:
+            return person_id
+    except ValueError:
+        pass
+    return None
+
+
+def get_name_index():
+    """
+    Returns the name index over the loaded people, building it if needed.
+    """
+    global name_index
+    if name_index is None:
+        name_index = NameIndex(names)
+    return name_index
+
+
+def resolve_person(name):
+    """
+    Returns the IMDB id for a person's name or id without prompting,
+    along with a list of candidate ids when the name is ambiguous,
+    or of the closest names when there is no one with that name.
+    """
+    if name in people:
+        return name, []
+    person_ids = sorted(names.get(name.lower(), set()))
+    if len(person_ids) == 1:
+        return person_ids[0], []
+    if len(person_ids) == 0:
+        return None, get_name_index().suggest(name)
+    return None, person_ids
+
+
+def answer_query(source_name, target_name, bidirectional=False, alt=False):
+    """
+    Answers one query between two names (or ids) and returns the
+    result as a dictionary ready to be written as JSON.
+    """
+    result, person_ids = _prepare_query(source_name, target_name)
+    if person_ids is None:
+        return result
+
+    if alt:
+        path = alt_shortest_path(*person_ids)
+    elif bidirectional:
+        path = bidirectional_shortest_path(*person_ids)
+    else:
+        path = shortest_path(*person_ids)
+
+    return _finish_query(result, path, search_stats["explored"])
+
+
+def _prepare_query(source_name, target_name):
+    """
+    Resolves the names of a query. Returns the partial result and the
+    pair of person ids, or the error result and None.
+    """
+    result = {"source": source_name, "target": target_name}
+
+    person_ids = []
+    for key, name in (("source", source_name), ("target", target_name)):
+        person_id, candidates = resolve_person(name)
+        if person_id is None:
+            if name.lower() in names:
+                result["error"] = f"ambiguous {key}"
+            else:
+                result["error"] = f"{key} not found"
+            result["candidates"] = [
+                {"id": candidate, **_describe_person(candidate)}
+                for candidate in candidates
+            ]
+            return result, None
+        person_ids.append(person_id)
+
+    return result, person_ids
+
+
+def _finish_query(result, path, explored):
+    """
+    Completes a query result with the path found by the search.
+    """
+    result["explored"] = explored
+    if path is None:
+        result["degrees"] = None
+        result["path"] = None
+    else:
+        result["degrees"] = len(path)
+        result["path"] = [
+            {
+                "movie_id": movie_id,
+                "title": movies[movie_id]["title"],
+                "person_id": person_id,
+                "name": people[person_id]["name"]
+            }
+            for movie_id, person_id in path
+        ]
+    return result
+
+
+def _describe_person(person_id):
+    person = people[person_id]
+    return {"name": person["name"], "birth": person["birth"]}
+
+
+def parse_query(line):
+    """
+    Parses one query line, either a JSON object with "source" and "target"
+    keys or two names separated by a tab. Returns None for blank lines.
+    """
+    line = line.strip()
+    if not line:
+        return None
+    if line.startswith("{"):
+        query = json.loads(line)
+        source, target = query["source"], query["target"]
+        if not isinstance(source, str) or not isinstance(target, str):
+            raise ValueError("source and target must be names")
+        return source, target
+    source, target = line.split("\t")
+    return source.strip(), target.strip()
+
+
+def _answer_line(line, bidirectional, alt):
+    """
+    Answers one query line, returning None for blank lines
+    and an error result for lines that cannot be parsed.
+    """
+    try:
+        query = parse_query(line)
+    except (ValueError, KeyError, TypeError):
+        return {"error": "malformed query", "query": line.strip()}
+    if query is None:
+        return None
+    with query_lock:
+        return answer_query(*query, bidirectional=bidirectional, alt=alt)
+
+
+def run_batch(infile, outfile, bidirectional=False, alt=False):
+    """
+    Answers every query line in `infile`, streaming one JSON result
+    per line to `outfile`.
+    """
+    for line in infile:
+        result = _answer_line(line, bidirectional, alt)
+        if result is None:
+            continue
+        outfile.write(json.dumps(result) + "\n")
+        outfile.flush()
+
+
+def run_parallel_batch(infile, outfile, workers, bidirectional=False,
+                       alt=False):
+    """
+    Answers every query line in `infile` like `run_batch`, searching the
+    compact graph in a pool of `workers` processes. The graph arrays are
+    placed in shared memory once instead of being copied to each worker.
+    Results are written in the order of the queries.
+    """
+    if alt and landmarks is None:
+        build_landmarks()
+    blocks, spec = graph.share()
+    try:
+        initargs = (spec, landmarks if alt else None)
+        with multiprocessing.Pool(workers, _init_worker, initargs) as pool:
+            for result, path, explored in pool.imap(
+                _search_worker, _parallel_tasks(infile, bidirectional, alt),
+                chunksize=16
+            ):
+                if "error" not in result:
+                    result = _finish_query(result, graph.path_ids(path),
+                                           explored)
+                outfile.write(json.dumps(result) + "\n")
+                outfile.flush()
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+def _parallel_tasks(infile, bidirectional, alt):
+    """
+    Yields (result, search) tasks for the query lines in `infile`, where
+    `search` is a (source, target, bidirectional, alt) tuple of graph
+    indexes and flags, or None when the result is already complete.
+    """
+    for line in infile:
+        try:
+            query = parse_query(line)
+        except (ValueError, KeyError, TypeError):
+            yield {"error": "malformed query", "query": line.strip()}, None
+            continue
+        if query is None:
+            continue
+        result, person_ids = _prepare_query(*query)
+        if person_ids is None:
+            yield result, None
+            continue
+        source, target = (graph.person_index[i] for i in person_ids)
+        yield result, (source, target, bidirectional, alt)
+
+
+def _init_worker(spec, worker_landmarks):
+    global worker_graph, landmarks
+    worker_graph = Graph.attach(spec)
+    landmarks = worker_landmarks
+
+
+def _search_worker(task):
+    """
+    Runs the search of one parallel batch task in a worker process.
+    """
+    result, search = task
+    if search is None:
+        return result, None, 0
+    source, target, bidirectional, alt = search
+    if alt:
+        path = worker_graph.alt_shortest_path(source, target, landmarks)
+    elif bidirectional:
+        path = worker_graph.bidirectional_shortest_path(source, target)
+    else:
+        path = worker_graph.shortest_path(source, target)
+    return result, path, worker_graph.explored
+
+
+class QueryHandler(socketserver.StreamRequestHandler):
+    """
+    Answers query lines from a client with JSON result lines
+    until the client closes the connection.
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            result = _answer_line(line.decode("utf-8"),
+                                  self.server.bidirectional, self.server.alt)
+            if result is None:
+                continue
+            self.wfile.write((json.dumps(result) + "\n").encode("utf-8"))
+
+
+class TCPQueryServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+if hasattr(socketserver, "UnixStreamServer"):
+    class UnixQueryServer(socketserver.ThreadingMixIn,
+                          socketserver.UnixStreamServer):
+        daemon_threads = True
+
+
+def serve(address, bidirectional=False, alt=False):
+    """
+    Answers queries over a socket until interrupted. `address` is
+    either HOST:PORT for TCP or the path of a Unix socket.
+
+    Raises ValueError if the path exists and is not a socket.
+    """
+    host, _, port = address.rpartition(":")
+    if port.isdigit():
+        server = TCPQueryServer((host or "localhost", int(port)), QueryHandler)
+    else:
+        # only a socket left behind by an earlier server is replaced
+        if os.path.exists(address):
+            if not stat.S_ISSOCK(os.stat(address).st_mode):
+                raise ValueError(f"{address} exists and is not a socket")
+            os.remove(address)
+        server = UnixQueryServer(address, QueryHandler)
+    server.bidirectional = bidirectional
+    server.alt = alt
+
+    with server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if isinstance(server.server_address, str):
+                os.remove(server.server_address)
+
 
 def neighbors_for_person(person_id):
     """
     Returns (movie_id, person_id) pairs for people
     who starred with a given person.
+
+    The pairs of recently expanded people are kept in a bounded
+    least-recently-used cache, so they are returned as a frozenset.
     """
+    return _cached_neighbors(person_id)
+
+
+def _neighbors_for_person(person_id):
+    if graph is not None:
+        return frozenset(graph.neighbors_for_person(person_id))
+
     movie_ids = people[person_id]["movies"]
     neighbors = set()
     for movie_id in movie_ids:
         for person_id in movies[movie_id]["stars"]:
             neighbors.add((movie_id, person_id))
-    return neighbors
+    return frozenset(neighbors)
+
+
+_cached_neighbors = functools.lru_cache(maxsize=NEIGHBOR_CACHE_SIZE)(
+    _neighbors_for_person
+)
+
+
+def set_neighbor_cache_size(size):
+    """
+    Replaces the neighbor cache with an empty one holding
+    at most `size` people (0 disables caching).
+    """
+    global _cached_neighbors
+    _cached_neighbors = functools.lru_cache(maxsize=size)(
+        _neighbors_for_person
+    )
+
+
+def neighbor_cache_info():
+    """
+    Returns the hits, misses, maxsize and current size
+    of the neighbor cache.
+    """
+    return _cached_neighbors.cache_info()
 
 
 if __name__ == "__main__":
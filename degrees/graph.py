@@ -0,0 +1,766 @@
+import hashlib
+import heapq
+import mmap
+import os
+from array import array
+from multiprocessing import shared_memory
+
+# CSR arrays written by Graph.save, with their array typecodes
+ARRAYS = {
+    "person_offsets": "q",
+    "person_movies": "i",
+    "movie_offsets": "q",
+    "movie_stars": "i"
+}
+
+# Marks the distance of a person a landmark cannot reach
+# in the byte tables of Landmarks
+FAR = 0x7F
+
+# Size of the fingerprint identifying the people of a graph
+FINGERPRINT_SIZE = 16
+
+# First bytes of the files written by Distances.save and Landmarks.save
+DISTANCES_MAGIC = b"degrees-dist-v2\n"
+LANDMARKS_MAGIC = b"degrees-ldmk-v2\n"
+
+# Sets the distance of an unreachable person to zero
+_REACHABLE = bytes(range(FAR)) + b"\0" + bytes(range(FAR + 1, 256))
+
+
+class Graph():
+    """
+    Compact form of the star graph between people and movies.
+
+    Person and movie IMDB ids are interned to dense integer indexes,
+    and the bipartite graph is stored twice in CSR form: the movies of
+    person `p` are `person_movies[person_offsets[p]:person_offsets[p + 1]]`
+    and the stars of movie `m` are
+    `movie_stars[movie_offsets[m]:movie_offsets[m + 1]]`.
+    """
+
+    def __init__(self, person_ids, movie_ids,
+                 person_offsets, person_movies, movie_offsets, movie_stars):
+        self.person_ids = person_ids
+        self.movie_ids = movie_ids
+        self.person_index = {
+            person_id: i for i, person_id in enumerate(person_ids)
+        }
+        self.movie_index = {
+            movie_id: i for i, movie_id in enumerate(movie_ids)
+        }
+        self.person_offsets = person_offsets
+        self.person_movies = person_movies
+        self.movie_offsets = movie_offsets
+        self.movie_stars = movie_stars
+
+        # number of people expanded by the most recent search
+        self.explored = 0
+
+        # digest of the person ids, computed on first use
+        self._fingerprint = None
+
+    @classmethod
+    def from_stars(cls, person_ids, movie_ids, star_people, star_movies):
+        """
+        Build a graph from parallel arrays of person and movie indexes,
+        one entry per row of stars.csv.
+        """
+        person_offsets, person_movies = _compress(
+            len(person_ids), star_people, star_movies
+        )
+        movie_offsets, movie_stars = _compress(
+            len(movie_ids), star_movies, star_people
+        )
+        return cls(person_ids, movie_ids,
+                   person_offsets, person_movies, movie_offsets, movie_stars)
+
+    def save(self, directory):
+        """
+        Write the CSR arrays of the graph into `directory`, one raw binary
+        file per array, so that `Graph.load` can memory-map them.
+        """
+        for name in ARRAYS:
+            with open(os.path.join(directory, f"{name}.bin"), "wb") as f:
+                getattr(self, name).tofile(f)
+
+    @classmethod
+    def load(cls, directory, person_ids, movie_ids):
+        """
+        Memory-map the CSR arrays written by `save` from `directory`.
+
+        Raises ValueError if their lengths do not match the number
+        of people and movies.
+        """
+        arrays = {
+            name: _map_array(os.path.join(directory, f"{name}.bin"), typecode)
+            for name, typecode in ARRAYS.items()
+        }
+        person_offsets = arrays["person_offsets"]
+        movie_offsets = arrays["movie_offsets"]
+        if (len(person_offsets) != len(person_ids) + 1
+                or len(movie_offsets) != len(movie_ids) + 1
+                or len(arrays["person_movies"]) != person_offsets[-1]
+                or len(arrays["movie_stars"]) != movie_offsets[-1]):
+            raise ValueError(f"graph arrays in {directory} do not match "
+                             "the people and movies")
+        return cls(person_ids, movie_ids, **arrays)
+
+    def fingerprint(self):
+        """
+        Returns a digest of the person ids of the graph, in index order,
+        which tells apart files computed for another dataset.
+        """
+        if self._fingerprint is None:
+            self._fingerprint = hashlib.blake2b(
+                "\n".join(self.person_ids).encode("utf-8"),
+                digest_size=FINGERPRINT_SIZE
+            ).digest()
+        return self._fingerprint
+
+    def share(self):
+        """
+        Copy the CSR arrays of the graph into shared memory blocks.
+
+        Returns the blocks, which the caller must close and unlink once
+        done, and a picklable description of them for `Graph.attach`.
+        """
+        blocks = []
+        spec = {}
+        for name, typecode in ARRAYS.items():
+            values = getattr(self, name)
+            data = memoryview(values).cast("B")
+            block = shared_memory.SharedMemory(
+                create=True, size=max(len(data), 8)
+            )
+            block.buf[:len(data)] = data
+            blocks.append(block)
+            spec[name] = (block.name, typecode, len(values))
+        return blocks, spec
+
+    @classmethod
+    def attach(cls, spec):
+        """
+        Attach to the shared memory blocks described by `spec`, as returned
+        by `share`, without copying them. The attached graph has no id
+        tables, so it can only be searched by index.
+        """
+        blocks = []
+        arrays = {}
+        for name, (block_name, typecode, length) in spec.items():
+            block = shared_memory.SharedMemory(name=block_name)
+            blocks.append(block)
+            arrays[name] = block.buf.cast(typecode)[:length]
+        graph = cls([], [], **arrays)
+        graph.blocks = blocks
+        return graph
+
+    def movies_for(self, person):
+        """
+        Returns the indexes of the movies a person starred in.
+        """
+        offsets = self.person_offsets
+        return self.person_movies[offsets[person]:offsets[person + 1]]
+
+    def stars_for(self, movie):
+        """
+        Returns the indexes of the people who starred in a movie.
+        """
+        offsets = self.movie_offsets
+        return self.movie_stars[offsets[movie]:offsets[movie + 1]]
+
+    def neighbors(self, person):
+        """
+        Yields (movie, person) index pairs for people
+        who starred with a given person.
+        """
+        for movie in self.movies_for(person):
+            for star in self.stars_for(movie):
+                yield movie, star
+
+    def neighbors_for_person(self, person_id):
+        """
+        Returns (movie_id, person_id) pairs for people
+        who starred with a given person.
+        """
+        movie_ids = self.movie_ids
+        person_ids = self.person_ids
+        return {
+            (movie_ids[movie], person_ids[star])
+            for movie, star in self.neighbors(self.person_index[person_id])
+        }
+
+    def path_ids(self, path):
+        """
+        Converts a path of (movie, person) index pairs
+        into (movie_id, person_id) pairs.
+        """
+        if path is None:
+            return None
+        return [
+            (self.movie_ids[movie], self.person_ids[person])
+            for movie, person in path
+        ]
+
+    def shortest_path(self, source, target):
+        """
+        Returns the shortest list of (movie, person) index pairs
+        that connect the source to the target, using breadth-first search.
+
+        If no possible path, returns None.
+        """
+        self.explored = 0
+
+        if source == target:
+            return []
+
+        # every star of a movie is reached the first time the movie is seen,
+        # so each movie only has to be expanded once
+        parents = {source: None}
+        seen_movies = set()
+        frontier = [source]
+
+        while frontier:
+            next_frontier = []
+
+            for person in frontier:
+                self.explored += 1
+
+                for movie in self.movies_for(person):
+                    if movie in seen_movies:
+                        continue
+                    seen_movies.add(movie)
+
+                    for star in self.stars_for(movie):
+                        if star in parents:
+                            continue
+                        parents[star] = (movie, person)
+                        if star == target:
+                            return _walk(parents, target)
+                        next_frontier.append(star)
+
+            frontier = next_frontier
+
+        return None
+
+    def bidirectional_shortest_path(self, source, target):
+        """
+        Returns the shortest list of (movie, person) index pairs
+        that connect the source to the target, growing one breadth-first
+        frontier from each end until they meet.
+
+        If no possible path, returns None.
+        """
+        self.explored = 0
+
+        if source == target:
+            return []
+
+        forward = {source: None}
+        backward = {target: None}
+        forward_movies = set()
+        backward_movies = set()
+        forward_frontier = [source]
+        backward_frontier = [target]
+
+        while forward_frontier and backward_frontier:
+
+            # always expand the smaller frontier by one whole level
+            if len(forward_frontier) <= len(backward_frontier):
+                frontier, reached, seen_movies, other = (
+                    forward_frontier, forward, forward_movies, backward
+                )
+            else:
+                frontier, reached, seen_movies, other = (
+                    backward_frontier, backward, backward_movies, forward
+                )
+
+            next_frontier = []
+            meeting = None
+
+            for person in frontier:
+                self.explored += 1
+
+                for movie in self.movies_for(person):
+                    if movie in seen_movies:
+                        continue
+                    seen_movies.add(movie)
+
+                    for star in self.stars_for(movie):
+                        if star in reached:
+                            continue
+                        reached[star] = (movie, person)
+                        next_frontier.append(star)
+                        if meeting is None and star in other:
+                            meeting = star
+
+            if meeting is not None:
+                path = _walk(forward, meeting)
+                person = meeting
+                while backward[person] is not None:
+                    movie, child = backward[person]
+                    path.append((movie, child))
+                    person = child
+                return path
+
+            if reached is forward:
+                forward_frontier = next_frontier
+            else:
+                backward_frontier = next_frontier
+
+        return None
+
+    def single_source(self, source):
+        """
+        Runs one breadth-first search from `source` over the whole graph
+        and returns the distance and parent of every person as `Distances`.
+        """
+        size = len(self.person_offsets) - 1
+        distances = array("i", [-1]) * size
+        parent_people = array("i", [-1]) * size
+        parent_movies = array("i", [-1]) * size
+
+        distances[source] = 0
+        seen_movies = bytearray(len(self.movie_offsets) - 1)
+        frontier = [source]
+        depth = 0
+
+        while frontier:
+            depth += 1
+            next_frontier = []
+
+            for person in frontier:
+                for movie in self.movies_for(person):
+                    if seen_movies[movie]:
+                        continue
+                    seen_movies[movie] = 1
+
+                    for star in self.stars_for(movie):
+                        if distances[star] != -1:
+                            continue
+                        distances[star] = depth
+                        parent_people[star] = person
+                        parent_movies[star] = movie
+                        next_frontier.append(star)
+
+            frontier = next_frontier
+
+        self.explored = size - distances.count(-1)
+        return Distances(source, distances, parent_people, parent_movies,
+                         self.fingerprint())
+
+    def alt_shortest_path(self, source, target, landmarks):
+        """
+        Returns the shortest list of (movie, person) index pairs
+        that connect the source to the target, using bidirectional
+        A* search with landmark distance lower bounds (ALT).
+
+        Each side expands people in order of the steps taken to reach
+        them plus a potential that averages the lower bounds on their
+        distance to the target and from the source, always on the side
+        with fewer people waiting, until no unexpanded pair of people can
+        improve on the best path found. People who cannot be on a path
+        shorter than the best one so far, or than the path through a
+        landmark, are never added.
+
+        If no possible path, returns None.
+        """
+        self.explored = 0
+
+        if source == target:
+            return []
+
+        tables = landmarks.active(source, target)
+        to_target = landmarks.bounds_to(target, tables)
+        if to_target[source] == FAR:
+            return None
+        from_source = landmarks.bounds_to(source, tables)
+        limit = landmarks.upper_bound(source, target)
+        if limit is None:
+            limit = len(self.person_offsets)
+
+        # keys are doubled to stay integers: twice the steps taken plus
+        # the difference of the two bounds, so that the forward and
+        # backward potentials cancel out on every path
+        forward = _Side(source, to_target, from_source)
+        backward = _Side(target, from_source, to_target)
+        best = limit + 1
+        meeting = None
+        unseen = limit + 1
+
+        while forward.heap and backward.heap:
+            if forward.heap[0][0] + backward.heap[0][0] >= 2 * best:
+                break
+
+            if (forward.heap[0][0], len(forward.heap)) <= (
+                    backward.heap[0][0], len(backward.heap)):
+                side, other = forward, backward
+            else:
+                side, other = backward, forward
+
+            _, depth, person = heapq.heappop(side.heap)
+            depth = -depth
+            if depth > side.depths[person]:
+                continue
+            self.explored += 1
+
+            depth += 1
+            depths = side.depths
+            parents = side.parents
+            movie_depths = side.movie_depths
+            ahead = side.ahead
+            behind = side.behind
+            for movie in self.movies_for(person):
+                if movie_depths.get(movie, unseen) <= depth:
+                    continue
+                movie_depths[movie] = depth
+
+                for star in self.stars_for(movie):
+                    if depths.get(star, unseen) <= depth:
+                        continue
+
+                    # a person who cannot be on a shorter path than
+                    # the best one so far is never added
+                    if depth + ahead[star] >= best:
+                        continue
+                    depths[star] = depth
+                    parents[star] = (movie, person)
+                    heapq.heappush(side.heap, (
+                        2 * depth + ahead[star] - behind[star], -depth, star
+                    ))
+
+                    if star in other.depths:
+                        length = depth + other.depths[star]
+                        if length < best:
+                            best = length
+                            meeting = star
+
+        if meeting is None:
+            return None
+        path = _walk(forward.parents, meeting)
+        person = meeting
+        while backward.parents[person] is not None:
+            movie, child = backward.parents[person]
+            path.append((movie, child))
+            person = child
+        return path
+
+
+class _Side():
+    """
+    State of one direction of `Graph.alt_shortest_path`: the steps and
+    parent of every person reached from `start`, the steps of every
+    movie expanded and the heap of people waiting to be expanded.
+
+    `ahead` bounds the distance from each person to the other end
+    and `behind` their distance from `start`.
+    """
+
+    def __init__(self, start, ahead, behind):
+        self.depths = {start: 0}
+        self.parents = {start: None}
+        self.movie_depths = {}
+        self.ahead = ahead
+        self.behind = behind
+        self.heap = [(ahead[start] - behind[start], 0, start)]
+
+
+class Distances():
+    """
+    Result of a single-source breadth-first search: the distance of every
+    person from `source` (-1 if unreachable), and the person and movie
+    that lead to them on a shortest path.
+    """
+
+    def __init__(self, source, distances, parent_people, parent_movies,
+                 fingerprint=None):
+        self.source = source
+        self.distances = distances
+        self.parent_people = parent_people
+        self.parent_movies = parent_movies
+
+        # fingerprint of the graph the distances were computed on
+        self.fingerprint = fingerprint
+
+    def path_to(self, person):
+        """
+        Returns the shortest list of (movie, person) index pairs
+        that connect the source to `person`, in time proportional
+        to the length of the path.
+
+        If no possible path, returns None.
+        """
+        if self.distances[person] == -1:
+            return None
+        path = []
+        while person != self.source:
+            path.append((self.parent_movies[person], person))
+            person = self.parent_people[person]
+        path.reverse()
+        return path
+
+    def save(self, filename):
+        """
+        Write the fingerprint, the source, the number of people
+        and the three arrays into a single binary file.
+        """
+        with open(filename, "wb") as f:
+            f.write(DISTANCES_MAGIC + self.fingerprint)
+            array("q", [self.source, len(self.distances)]).tofile(f)
+            self.distances.tofile(f)
+            self.parent_people.tofile(f)
+            self.parent_movies.tofile(f)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Memory-map distances written by `save`.
+        """
+        with open(filename, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        fingerprint = _check_header(
+            view, DISTANCES_MAGIC, filename, "distances"
+        )
+        header = len(DISTANCES_MAGIC) + FINGERPRINT_SIZE
+        source, size = view[header:header + 16].cast("q")
+        if size < 0 or len(view) - header - 16 != 12 * size:
+            raise ValueError(f"{filename} is truncated")
+        values = view[header + 16:].cast("i")
+        return cls(source, values[:size], values[size:2 * size],
+                   values[2 * size:3 * size], fingerprint)
+
+
+class Landmarks():
+    """
+    Distances from a few landmark people to everyone, which bound the
+    distance between any two people by the triangle inequality.
+
+    Each distance table holds one byte per person: the distance from
+    the landmark, capped at FAR - 1, or FAR if the person is unreachable.
+    """
+
+    def __init__(self, people, distances, fingerprint=None):
+        self.people = people
+        self.distances = distances
+        self.fingerprint = fingerprint
+
+        # the high bit of every byte, for comparing tables byte by byte
+        size = len(distances[0]) if distances else 0
+        self.high_bits = int.from_bytes(b"\x80" * size, "little")
+
+        # translation tables of bounds_to, by distance to the target
+        self.bound_tables = [_bound_table(to_target)
+                             for to_target in range(FAR + 1)]
+
+    @classmethod
+    def build(cls, graph, count=8):
+        """
+        Choose `count` landmarks by farthest-point selection and run
+        a breadth-first search from each of them.
+
+        The first landmark is the person who starred in the most movies,
+        whose short distances to everyone make paths through them good
+        upper bounds. Every next one is the person farthest from all
+        landmarks so far, so that the others sit on the edges of the
+        graph, where they give good lower bounds, rather than next to
+        each other.
+        """
+        size = len(graph.person_offsets) - 1
+        if size == 0:
+            return cls([], [], graph.fingerprint())
+        offsets = graph.person_offsets
+        hub = max(range(size), key=lambda p: offsets[p + 1] - offsets[p])
+
+        people = [hub]
+        distances = [_distance_table(graph.single_source(hub).distances)]
+        closest = distances[0]
+        while len(people) < count:
+            # unreachable people count as distance zero, so they are
+            # never chosen, and zero everywhere means no one is left
+            candidates = closest.translate(_REACHABLE)
+            farthest = max(candidates)
+            if farthest == 0:
+                break
+            landmark = candidates.index(farthest)
+
+            table = _distance_table(graph.single_source(landmark).distances)
+            closest = bytes(map(min, closest, table))
+            people.append(landmark)
+            distances.append(table)
+
+        return cls(people, distances, graph.fingerprint())
+
+    def active(self, source, target, count=4):
+        """
+        Returns the distance tables of the `count` landmarks giving the
+        highest lower bound on the distance from `source` to `target`.
+        """
+        return heapq.nlargest(
+            count, self.distances,
+            key=lambda distances: abs(distances[source] - distances[target])
+        )
+
+    def bounds_to(self, target, tables=None):
+        """
+        Returns a table with one byte per person: a lower bound on the
+        distance from that person to `target`, or FAR if the person
+        cannot reach it. Only the given distance `tables` are used,
+        or all of them by default.
+        """
+        size = len(self.distances[0]) if self.distances else 0
+        high = self.high_bits
+        best = 0
+        for distances in tables or self.distances:
+            bound = int.from_bytes(
+                distances.translate(self.bound_tables[distances[target]]),
+                "little"
+            )
+
+            # every byte is below 0x80, so subtracting the bytes of
+            # `bound` from those of `best` with their high bit set never
+            # borrows across bytes, and leaves that bit set where the
+            # byte of `best` is the larger one
+            larger = ((((best | high) - bound) & high) >> 7) * 0xFF
+            best = (best & larger) | (bound & ~larger)
+        return best.to_bytes(size, "little")
+
+    def upper_bound(self, source, target):
+        """
+        Returns the length of the shortest path from `source` to `target`
+        through a landmark, or None if no landmark reaches both.
+        """
+        best = None
+        for distances in self.distances:
+            to_source = distances[source]
+            to_target = distances[target]
+
+            # capped distances may be shorter than the real ones
+            if to_source >= FAR - 1 or to_target >= FAR - 1:
+                continue
+            if best is None or to_source + to_target < best:
+                best = to_source + to_target
+        return best
+
+    def save(self, filename):
+        """
+        Write the fingerprint, the landmarks and their distance tables
+        into a single file.
+        """
+        size = len(self.distances[0]) if self.distances else 0
+        with open(filename, "wb") as f:
+            f.write(LANDMARKS_MAGIC + self.fingerprint)
+            array("q", [len(self.people), size]).tofile(f)
+            array("i", self.people).tofile(f)
+            for distances in self.distances:
+                f.write(distances)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Read landmarks written by `save`.
+        """
+        with open(filename, "rb") as f:
+            data = f.read()
+        view = memoryview(data)
+        fingerprint = _check_header(
+            view, LANDMARKS_MAGIC, filename, "landmarks"
+        )
+        header = len(LANDMARKS_MAGIC) + FINGERPRINT_SIZE
+        count, size = view[header:header + 16].cast("q")
+        start = header + 16 + 4 * count
+        if len(data) != start + count * size:
+            raise ValueError(f"{filename} is truncated")
+        people = list(view[header + 16:start].cast("i"))
+        distances = [
+            data[start + i * size:start + (i + 1) * size]
+            for i in range(count)
+        ]
+        return cls(people, distances, fingerprint)
+
+
+def _distance_table(distances):
+    """
+    Converts the distances of a single-source search into a table of
+    one byte per person, as used by `Landmarks`.
+    """
+    return bytes(
+        FAR if distance == -1 else min(distance, FAR - 1)
+        for distance in distances
+    )
+
+
+def _bound_table(to_target):
+    """
+    Returns the translation from the distance of a person to a landmark
+    into a lower bound on their distance to a target `to_target` away.
+
+    A landmark that reaches only one of the two puts them in
+    different components.
+    """
+    if to_target == FAR:
+        return bytes([FAR] * FAR + [0] * (256 - FAR))
+    return bytes(
+        [abs(to_target - distance) for distance in range(FAR)]
+        + [FAR] * (256 - FAR)
+    )
+
+
+def _check_header(view, magic, filename, kind):
+    """
+    Checks that a file starts with `magic` and returns the fingerprint
+    that follows it.
+    """
+    header = len(magic) + FINGERPRINT_SIZE
+    if len(view) < header + 16 or bytes(view[:len(magic)]) != magic:
+        raise ValueError(f"{filename} is not a {kind} file")
+    return bytes(view[len(magic):header])
+
+
+def _compress(size, rows, columns):
+    """
+    Group `columns` by `rows` into CSR offsets and indexes,
+    where every row is an integer in range(size).
+    """
+    offsets = array("q", [0]) * (size + 1)
+    for row in rows:
+        offsets[row + 1] += 1
+    for i in range(size):
+        offsets[i + 1] += offsets[i]
+
+    indexes = array("i", [0]) * len(columns)
+    position = array("q", offsets[:-1])
+    for row, column in zip(rows, columns):
+        indexes[position[row]] = column
+        position[row] += 1
+
+    return offsets, indexes
+
+
+def _map_array(filename, typecode):
+    """
+    Memory-map a file written by `array.tofile` as a read-only sequence
+    of integers with the given typecode.
+    """
+    with open(filename, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size % array(typecode).itemsize:
+            raise ValueError(f"{filename} is truncated")
+        if size == 0:
+            return array(typecode)
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mapped).cast(typecode)
+
+
+def _walk(parents, person):
+    """
+    Follows a parent map from `person` back to the start of the search
+    and returns the (movie, person) index pairs along the way in order.
+    """
+    path = []
+    while parents[person] is not None:
+        movie, parent = parents[person]
+        path.append((movie, person))
+        person = parent
+    path.reverse()
+    return path
@@ -0,0 +1,250 @@
+from array import array
+from bisect import bisect_left
+from os.path import commonprefix
+
+# Most names taken from the rarest word of a query by NameIndex.fuzzy
+MAX_CANDIDATES = 2000
+
+
+class NameIndex():
+    """
+    Sorted index over lowercased names for exact, prefix and
+    typo-tolerant lookup of person ids.
+
+    `keys` is the sorted list of distinct names and `ids[i]` the
+    person ids sharing `keys[i]`, so ambiguous names resolve to all
+    of their people without looking at anyone else. `tokens` maps every
+    distinct word to the indexes of the names containing it, and
+    `deletes` every single-character deletion of a word to the words
+    it came from.
+    """
+
+    def __init__(self, names):
+        self.keys = sorted(names)
+        self.ids = [sorted(names[key]) for key in self.keys]
+
+        tokens = {}
+        for i, key in enumerate(self.keys):
+            for token in set(key.split()):
+                if token in tokens:
+                    tokens[token].append(i)
+                else:
+                    tokens[token] = array("i", [i])
+
+        deletes = {}
+        for token in tokens:
+            for variant in _deletions(token):
+                if variant in deletes:
+                    deletes[variant].append(token)
+                else:
+                    deletes[variant] = [token]
+
+        self.tokens = tokens
+        self.deletes = deletes
+
+    def exact(self, name):
+        """
+        Returns the ids of the people with exactly this name.
+        """
+        name = name.lower()
+        i = bisect_left(self.keys, name)
+        if i < len(self.keys) and self.keys[i] == name:
+            return list(self.ids[i])
+        return []
+
+    def prefix(self, text, limit=10):
+        """
+        Returns the ids of the people whose names start with `text`,
+        in alphabetical order of name, at most `limit` of them.
+        """
+        text = text.lower()
+        matches = []
+        i = bisect_left(self.keys, text)
+        while i < len(self.keys) and self.keys[i].startswith(text):
+            matches.extend(self.ids[i])
+            if len(matches) >= limit:
+                return matches[:limit]
+            i += 1
+        return matches
+
+    def fuzzy(self, text, max_distance=2, limit=10):
+        """
+        Returns the ids of the people whose names are within `max_distance`
+        edits of `text`, closest first, at most `limit` of them.
+
+        Candidates are names where every word of `text` matches one of
+        their words up to a single typo, a deleted space or an inserted
+        space. They are taken from the rarest word of `text`, at most
+        MAX_CANDIDATES of them, and narrowed down by the other words
+        before their edit distance to `text` is computed.
+        """
+        text = text.lower()
+        words = text.split()
+        if not words:
+            return []
+
+        # the rarest word is looked up first
+        choices = [self._word_tokens(words, i) for i in range(len(words))]
+        choices.sort(key=self._count)
+
+        candidates = set()
+        for token in sorted(choices[0], key=self._count_token):
+            candidates.update(self.tokens[token])
+            if len(candidates) >= MAX_CANDIDATES:
+                break
+        for close in choices[1:]:
+            # whichever side is smaller is the one walked through
+            if self._count(close) <= len(candidates):
+                candidates &= set().union(
+                    *(self.tokens[token] for token in close)
+                )
+            else:
+                candidates = {
+                    i for i in candidates
+                    if not close.isdisjoint(self.keys[i].split())
+                }
+
+        # names one edit away are found by comparing strings, and the
+        # slower edit distance is only computed if they are not enough
+        scored = []
+        rest = []
+        for i in candidates:
+            key = self.keys[i]
+            if abs(len(key) - len(text)) > max_distance:
+                continue
+            if max_distance >= 1 and _within_one_edit(text, key):
+                scored.append((int(key != text), key, i))
+            else:
+                rest.append(i)
+        if sum(len(self.ids[i]) for _, _, i in scored) < limit:
+            for i in rest:
+                distance = edit_distance(text, self.keys[i], max_distance)
+                if distance <= max_distance:
+                    scored.append((distance, self.keys[i], i))
+        scored.sort()
+
+        matches = []
+        for _, _, i in scored:
+            matches.extend(self.ids[i])
+            if len(matches) >= limit:
+                return matches[:limit]
+        return matches
+
+    def suggest(self, text, limit=10):
+        """
+        Returns the ids of the closest names to `text`, trying
+        typo-tolerant lookup first and names starting with `text` next.
+        """
+        return self.fuzzy(text, limit=limit) or self.prefix(text, limit)
+
+    def _word_tokens(self, words, position):
+        """
+        Returns the indexed words that the word of a query at `position`
+        may stand for: the words within one edit of it, the rarer half
+        of it if it is two indexed words without the space between them,
+        and its concatenation with a neighbor if that is an indexed word.
+        """
+        word = words[position]
+        close = self._close_tokens(word)
+
+        for i in range(1, len(word)):
+            left, right = word[:i], word[i:]
+            if left in self.tokens and right in self.tokens:
+                close.add(min(left, right, key=self._count_token))
+
+        if position > 0 and words[position - 1] + word in self.tokens:
+            close.add(words[position - 1] + word)
+        if (position + 1 < len(words)
+                and word + words[position + 1] in self.tokens):
+            close.add(word + words[position + 1])
+
+        return close
+
+    def _count(self, close):
+        """
+        Returns the number of names containing any of the words `close`.
+        """
+        return sum(map(self._count_token, close))
+
+    def _count_token(self, token):
+        return len(self.tokens[token])
+
+    def _close_tokens(self, word):
+        """
+        Returns the indexed words within one edit of `word`.
+        """
+        close = set()
+        if word in self.tokens:
+            close.add(word)
+
+        # a substitution or transposition leaves a deletion in common,
+        # an insertion or deletion turns one word into a deletion of the other
+        close.update(self.deletes.get(word, ()))
+        for variant in _deletions(word):
+            if variant in self.tokens:
+                close.add(variant)
+            close.update(self.deletes.get(variant, ()))
+
+        return {token for token in close if _within_one_edit(word, token)}
+
+
+def edit_distance(a, b, limit):
+    """
+    Returns the number of insertions, deletions, substitutions and
+    adjacent transpositions turning `a` into `b`, or `limit + 1` as
+    soon as it is known to exceed `limit`.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    # a common prefix or suffix never needs an edit
+    start = len(commonprefix((a, b)))
+    a, b = a[start:], b[start:]
+    end = len(commonprefix((a[::-1], b[::-1])))
+    a, b = a[:len(a) - end], b[:len(b) - end]
+    if not a or not b:
+        return min(len(a) + len(b), limit + 1)
+
+    previous = None
+    row = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, row = previous, row, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            row[j] = min(previous[j] + 1, row[j - 1] + 1,
+                         previous[j - 1] + cost)
+            if (i > 1 and j > 1 and a[i - 1] == b[j - 2]
+                    and a[i - 2] == b[j - 1]):
+                row[j] = min(row[j], before[j - 2] + 1)
+        # transpositions reach back two rows, so both must exceed the limit
+        if min(row) > limit and min(previous) > limit:
+            return limit + 1
+
+    return min(row[-1], limit + 1)
+
+
+def _within_one_edit(a, b):
+    """
+    Returns whether `edit_distance(a, b, 1) <= 1`, comparing
+    the strings around their first difference only.
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    if len(a) - len(b) > 1:
+        return False
+    i = len(commonprefix((a, b)))
+    if i == len(a):
+        return True
+    if len(a) != len(b):
+        return a[i + 1:] == b[i:]
+    return a[i + 1:] == b[i + 1:] or (
+        a[i + 1:i + 2] == b[i:i + 1] and a[i:i + 1] == b[i + 1:i + 2]
+        and a[i + 2:] == b[i + 2:]
+    )
+
+
+def _deletions(word):
+    """
+    Returns the distinct strings made by deleting one character of `word`.
+    """
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
@@ -1,6 +1,8 @@
+import argparse
 import csv
 import itertools
-import sys
+
+from inference import marginals
 
 PROBS = {
 
@@ -38,27 +40,56 @@ PROBS = {
 
 
 def main():
+    parser = argparse.ArgumentParser(
+        description="Infer gene and trait probabilities in a family."
+    )
+    parser.add_argument("data", help="CSV file of the family")
+    parser.add_argument("--engine",
+                        choices=["enumerate", "bitmask", "vectorized",
+                                 "parallel", "elimination"],
+                        default="enumerate",
+                        help="enumerate every assignment of genes and "
+                             "traits as sets, as bitmasks or in blocks of "
+                             "arrays, in one process or several, or "
+                             "compute exact marginals by variable "
+                             "elimination")
+    parser.add_argument("--processes", type=int,
+                        help="worker processes for the parallel engine "
+                             "(default: one per core)")
+    args = parser.parse_args()
+    people = load_data(args.data)
+
+    if args.engine == "elimination":
+        probabilities = marginals(people, PROBS)
+    elif args.engine == "bitmask":
+        probabilities = bitmask_probabilities(people)
+    elif args.engine == "vectorized":
+        probabilities = vectorized_probabilities(people)
+    elif args.engine == "parallel":
+        probabilities = vectorized_probabilities(people,
+                                                 processes=args.processes)
+    else:
+        probabilities = enumerate_probabilities(people)
 
-    # Check for proper usage
-    if len(sys.argv) != 2:
-        sys.exit("Usage: python heredity.py data.csv")
-    people = load_data(sys.argv[1])
+    # Print results
+    for person in people:
+        print(f"{person}:")
+        for field in probabilities[person]:
+            print(f"  {field.capitalize()}:")
+            for value in probabilities[person][field]:
+                p = probabilities[person][field][value]
+                print(f"    {value}: {p:.4f}")
+
+
+def enumerate_probabilities(people):
+    """
+    Return the gene and trait probabilities of every person, by adding
+    up the joint probability of every assignment of genes and traits
+    consistent with the known traits, then normalizing.
+    """
 
     # Keep track of gene and trait probabilities for each person
-    probabilities = {
-        person: {
-            "gene": {
-                2: 0,
-                1: 0,
-                0: 0
-            },
-            "trait": {
-                True: 0,
-                False: 0
-            }
-        }
-        for person in people
-    }
+    probabilities = new_probabilities(people)
 
     # Loop over all sets of people who might have the trait
     names = set(people)
@@ -84,14 +115,65 @@ def main():
     # Ensure probabilities sum to 1
     normalize(probabilities)
 
-    # Print results
-    for person in people:
-        print(f"{person}:")
-        for field in probabilities[person]:
-            print(f"  {field.capitalize()}:")
-            for value in probabilities[person][field]:
-                p = probabilities[person][field][value]
-                print(f"    {value}: {p:.4f}")
+    return probabilities
+
+
+def bitmask_probabilities(people):
+    """
+    Return the gene and trait probabilities of every person like
+    `enumerate_probabilities`, streaming the assignments as bitmasks
+    from `assignments` instead of building sets.
+    """
+    probabilities = new_probabilities(people)
+    names = list(people)
+    parents = parent_indexes(people)
+    for one_gene, two_genes, have_trait in assignments(people):
+        p = mask_joint_probability(parents, one_gene, two_genes, have_trait)
+        mask_update(probabilities, names, one_gene, two_genes, have_trait, p)
+    normalize(probabilities)
+    return probabilities
+
+
+def vectorized_probabilities(people, processes=1):
+    """
+    Return the gene and trait probabilities of every person like
+    `enumerate_probabilities`, computing the joint probabilities of
+    whole blocks of assignments at once with NumPy, in `processes`
+    worker processes unless it is 1 (all cores if None).
+    """
+    # NumPy is only needed by the vectorized engines
+    from vectorized import (
+        Family, enumerate_blocks, parallel_enumerate_blocks, to_probabilities
+    )
+
+    family = Family(people, PROBS)
+    if processes == 1:
+        totals = enumerate_blocks(family)
+    else:
+        totals = parallel_enumerate_blocks(family, processes)
+    probabilities = to_probabilities(family, *totals)
+    normalize(probabilities)
+    return probabilities
+
+
+def new_probabilities(people):
+    """
+    Return a table of gene and trait probabilities of 0 for each person.
+    """
+    return {
+        person: {
+            "gene": {
+                2: 0,
+                1: 0,
+                0: 0
+            },
+            "trait": {
+                True: 0,
+                False: 0
+            }
+        }
+        for person in people
+    }
 
 
 def load_data(filename):
@@ -128,6 +210,59 @@ def powerset(s):
     ]
 
 
+def submasks(mask):
+    """
+    Yield every subset of the bits set in `mask`, from `mask` down to 0.
+    """
+    subset = mask
+    while True:
+        yield subset
+        if subset == 0:
+            return
+        subset = (subset - 1) & mask
+
+
+def assignments(people):
+    """
+    Yield every assignment of genes and traits consistent with the
+    known traits, as bitmasks `one_gene`, `two_genes` and `have_trait`
+    where bit i stands for the i-th person of `people`.
+
+    People with a known trait keep it, so only the traits of the others
+    are enumerated, and no assignment is built only to be rejected.
+    """
+    everyone = (1 << len(people)) - 1
+    known_trait = 0
+    unknown = 0
+    for i, person in enumerate(people):
+        trait = people[person]["trait"]
+        if trait is None:
+            unknown |= 1 << i
+        elif trait:
+            known_trait |= 1 << i
+
+    for traits in submasks(unknown):
+        have_trait = known_trait | traits
+        for two_genes in submasks(everyone):
+            for one_gene in submasks(everyone & ~two_genes):
+                yield one_gene, two_genes, have_trait
+
+
+def parent_indexes(people):
+    """
+    Return, for each person in the order of `people`, the indexes of
+    their mother and father, or None for both if they have no parents.
+    Like in `joint_probability`, a single missing parent counts as a
+    parent without the gene.
+    """
+    index = {person: i for i, person in enumerate(people)}
+    return [
+        (index.get(people[person]["mother"]),
+         index.get(people[person]["father"]))
+        for person in people
+    ]
+
+
 def joint_probability(people, one_gene, two_genes, have_trait):
     """
     Compute and return a joint probability.
@@ -193,6 +328,46 @@ def joint_probability(people, one_gene, two_genes, have_trait):
 
     return probability
 
+def mask_joint_probability(parents, one_gene, two_genes, have_trait):
+    """
+    Compute the joint probability like `joint_probability`, for people
+    given by their `parents` as returned by `parent_indexes` and sets of
+    people given as bitmasks.
+    """
+    probability = 1
+    for i, (mother, father) in enumerate(parents):
+        gene_copy = 2 if two_genes >> i & 1 else one_gene >> i & 1
+        has_trait = bool(have_trait >> i & 1)
+
+        if mother is None and father is None:
+            probability *= PROBS["gene"][gene_copy]
+        else:
+            from_mother = _mask_passing(mother, one_gene, two_genes)
+            from_father = _mask_passing(father, one_gene, two_genes)
+            probability *= (
+                from_mother * from_father if gene_copy == 2 else
+                from_mother * (1 - from_father) +
+                from_father * (1 - from_mother) if gene_copy == 1 else
+                (1 - from_mother) * (1 - from_father)
+            )
+
+        probability *= PROBS["trait"][gene_copy][has_trait]
+
+    return probability
+
+
+def _mask_passing(parent, one_gene, two_genes):
+    """
+    Return the probability that the parent with index `parent` passes
+    the gene on, with a missing parent counting as having none.
+    """
+    if parent is not None and two_genes >> parent & 1:
+        return 1 - PROBS["mutation"]
+    if parent is not None and one_gene >> parent & 1:
+        return 0.5
+    return PROBS["mutation"]
+
+
 def update(probabilities, one_gene, two_genes, have_trait, p):
     """
     Add to `probabilities` a new joint probability `p`.
@@ -214,6 +389,18 @@ def update(probabilities, one_gene, two_genes, have_trait, p):
         probabilities[person]["gene"][gene_copy] += p
         probabilities[person]["trait"][has_trait] += p
 
+
+def mask_update(probabilities, names, one_gene, two_genes, have_trait, p):
+    """
+    Add `p` to `probabilities` like `update`, for sets of people given
+    as bitmasks over `names`.
+    """
+    for i, person in enumerate(names):
+        gene_copy = 2 if two_genes >> i & 1 else one_gene >> i & 1
+        probabilities[person]["gene"][gene_copy] += p
+        probabilities[person]["trait"][bool(have_trait >> i & 1)] += p
+
+
 def normalize(probabilities):
     """
     Update `probabilities` such that each probability distribution
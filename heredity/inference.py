@@ -0,0 +1,265 @@
+import itertools
+
+# Number of copies of the gene a person can have
+GENES = (0, 1, 2)
+
+
+class Factor():
+    """
+    Non-negative function of the gene counts of some people, stored as
+    a table from every combination of their gene counts, in the order
+    of `variables`, to its value.
+    """
+
+    def __init__(self, variables, table):
+        self.variables = tuple(variables)
+        self.table = table
+
+    @classmethod
+    def from_function(cls, variables, function):
+        """
+        Tabulate `function`, called with one gene count per variable.
+        """
+        return cls(variables, {
+            genes: function(*genes)
+            for genes in itertools.product(GENES, repeat=len(variables))
+        })
+
+    def __mul__(self, other):
+        variables = self.variables + tuple(
+            variable for variable in other.variables
+            if variable not in self.variables
+        )
+        mine = [variables.index(variable) for variable in self.variables]
+        theirs = [variables.index(variable) for variable in other.variables]
+        return Factor(variables, {
+            genes: (self.table[tuple(genes[i] for i in mine)] *
+                    other.table[tuple(genes[i] for i in theirs)])
+            for genes in itertools.product(GENES, repeat=len(variables))
+        })
+
+    def sum_out(self, variable):
+        """
+        Return the factor over the other variables,
+        adding up the values for every gene count of `variable`.
+        """
+        i = self.variables.index(variable)
+        table = {}
+        for genes, value in self.table.items():
+            rest = genes[:i] + genes[i + 1:]
+            table[rest] = table.get(rest, 0) + value
+        return Factor(self.variables[:i] + self.variables[i + 1:], table)
+
+    def normalized(self):
+        """
+        Return the factor scaled so that its values sum to 1,
+        or unchanged if they are all 0.
+        """
+        total = sum(self.table.values())
+        if not total:
+            return self
+        return Factor(self.variables, {
+            genes: value / total for genes, value in self.table.items()
+        })
+
+    def keep(self, *variables):
+        """
+        Return the factor over `variables`, summing all others out.
+        """
+        result = self
+        for variable in self.variables:
+            if variable not in variables:
+                result = result.sum_out(variable)
+        return result
+
+
+def compile_factors(people, probs):
+    """
+    Return the factors of the joint probability of everyone's gene
+    count and the known traits of `people`, as loaded by `load_data`:
+    for every person, the probability of their gene count given their
+    parents' (or unconditionally, without parents), times the
+    probability of their trait if it is known.
+    """
+    factors = []
+    for person in people:
+        mother = people[person]["mother"]
+        father = people[person]["father"]
+        trait = people[person]["trait"]
+
+        def observe(genes):
+            if trait is None:
+                return 1
+            return probs["trait"][genes][trait]
+
+        if mother is None and father is None:
+            factors.append(Factor.from_function(
+                [person], lambda genes: probs["gene"][genes] * observe(genes)
+            ))
+            continue
+
+        # a missing parent passes the gene as if they had none
+        parents = [parent for parent in (mother, father) if parent is not None]
+
+        def inherit(genes, *parent_genes):
+            passes = [_passing(copies, probs) for copies in parent_genes]
+            passes += [probs["mutation"]] * (2 - len(passes))
+            return _child_probability(genes, *passes) * observe(genes)
+
+        factors.append(Factor.from_function([person] + parents, inherit))
+    return factors
+
+
+def _passing(copies, probs):
+    """
+    Return the probability that a parent with `copies` of the gene
+    passes it on to a child.
+    """
+    if copies == 2:
+        return 1 - probs["mutation"]
+    if copies == 1:
+        return 0.5
+    return probs["mutation"]
+
+
+def _child_probability(genes, mother, father):
+    """
+    Return the probability of a child having `genes` copies of the gene
+    when their parents pass it with probabilities `mother` and `father`.
+    """
+    if genes == 2:
+        return mother * father
+    if genes == 1:
+        return mother * (1 - father) + father * (1 - mother)
+    return (1 - mother) * (1 - father)
+
+
+def elimination_order(factors):
+    """
+    Return an order to sum the variables of `factors` out in, and for
+    each variable the other variables it shares a factor with when it
+    is summed out.
+
+    Variables are chosen greedily, each time one sharing factors with
+    the fewest others, so that on pedigrees without marriages between
+    relatives no factor grows beyond a person, their partner and their
+    parents, however large the family.
+    """
+    neighbors = {}
+    for factor in factors:
+        for variable in factor.variables:
+            neighbors.setdefault(variable, set()).update(factor.variables)
+    for variable in neighbors:
+        neighbors[variable].discard(variable)
+
+    order = []
+    separators = {}
+    remaining = set(neighbors)
+    while remaining:
+        variable = min(remaining, key=lambda variable: (
+            len(neighbors[variable]), variable
+        ))
+        remaining.remove(variable)
+        order.append(variable)
+        separators[variable] = neighbors.pop(variable)
+
+        # summing the variable out joins its neighbors in one factor
+        for neighbor in separators[variable]:
+            neighbors[neighbor].discard(variable)
+            neighbors[neighbor].update(separators[variable] - {neighbor})
+    return order, separators
+
+
+def calibrate(factors):
+    """
+    Return, for every variable of `factors`, the factor over that
+    variable alone proportional to its marginal in their product.
+
+    Summing the variables out in `elimination_order` turns the factors
+    into a tree of cliques, one for each variable with the neighbors it
+    had when summed out. Messages are passed up the tree as in variable
+    elimination, then back down, so that every marginal comes out of a
+    single pass in each direction. Messages are scaled to sum to 1,
+    since only the proportions matter, so that they do not underflow in
+    large families.
+    """
+    order, separators = elimination_order(factors)
+    position = {variable: i for i, variable in enumerate(order)}
+
+    # every clique hands its message to the clique of the first of its
+    # other variables to be summed out, which contains all of them
+    parent = {
+        variable: min(separators[variable], key=position.get, default=None)
+        for variable in order
+    }
+    children = {variable: [] for variable in order}
+    for variable in order:
+        if parent[variable] is not None:
+            children[parent[variable]].append(variable)
+
+    assigned = {variable: [] for variable in order}
+    for factor in factors:
+        if factor.variables:
+            assigned[min(factor.variables, key=position.get)].append(factor)
+
+    up = {}
+    for variable in order:
+        product = _product(assigned[variable] +
+                           [up[child] for child in children[variable]])
+        up[variable] = product.sum_out(variable).normalized()
+
+    down = {}
+    beliefs = {}
+    for variable in reversed(order):
+        incoming = list(assigned[variable])
+        if parent[variable] is not None:
+            incoming.append(down[variable])
+        messages = [up[child] for child in children[variable]]
+        beliefs[variable] = _product(incoming + messages).keep(variable)
+
+        for i, child in enumerate(children[variable]):
+            others = messages[:i] + messages[i + 1:]
+            down[child] = _product(incoming + others).keep(
+                *separators[child]
+            ).normalized()
+    return beliefs
+
+
+def _product(factors):
+    result = Factor([], {(): 1})
+    for factor in factors:
+        result = result * factor
+    return result
+
+
+def marginals(people, probs):
+    """
+    Return the probabilities of every gene count and trait of each
+    person given the known traits, in the format of the `probabilities`
+    dictionary of `heredity.main`, already normalized.
+
+    Everyone's gene distribution is computed exactly by `calibrate`,
+    and their trait distribution follows from it, or from the evidence
+    if their trait is known.
+    """
+    beliefs = calibrate(compile_factors(people, probs))
+    probabilities = {}
+    for person in people:
+        result = beliefs[person]
+        total = sum(result.table.values())
+        genes = {copies: result.table[(copies,)] / total for copies in GENES}
+
+        trait = people[person]["trait"]
+        if trait is None:
+            has_trait = sum(
+                genes[copies] * probs["trait"][copies][True]
+                for copies in GENES
+            )
+        else:
+            has_trait = 1 if trait else 0
+
+        probabilities[person] = {
+            "gene": {copies: genes[copies] for copies in (2, 1, 0)},
+            "trait": {True: has_trait, False: 1 - has_trait}
+        }
+    return probabilities
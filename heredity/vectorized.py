@@ -0,0 +1,233 @@
+import multiprocessing
+import os
+
+import numpy as np
+
+# Number of people whose gene counts vary within a block of
+# assignments evaluated together, which holds 3 ** BLOCK_DIGITS of them
+BLOCK_DIGITS = 10
+
+# Shards of blocks handed to each worker process, on average,
+# by parallel_enumerate_blocks
+SHARDS_PER_PROCESS = 4
+
+# Family enumerated by each worker process of parallel_enumerate_blocks
+worker_family = None
+
+
+class Family():
+    """
+    Family of people in the order of `people`, as arrays: the index
+    of every person's mother and father, the traits that are known,
+    and tables of the probabilities in `probs`.
+
+    People without parents have -1 as both parent indexes. A single
+    missing parent has index `len(people)`, a row of genes that is
+    always 0, so that they count as a parent without the gene like in
+    `joint_probability`.
+    """
+
+    def __init__(self, people, probs):
+        index = {person: i for i, person in enumerate(people)}
+        n = len(people)
+        self.names = list(people)
+        self.mothers = np.full(n, -1)
+        self.fathers = np.full(n, -1)
+        for i, person in enumerate(people):
+            mother = people[person]["mother"]
+            father = people[person]["father"]
+            if mother is not None or father is not None:
+                self.mothers[i] = index.get(mother, n)
+                self.fathers[i] = index.get(father, n)
+        self.founders = self.mothers == -1
+
+        traits = [people[person]["trait"] for person in people]
+        self.unknown = np.array(
+            [i for i, trait in enumerate(traits) if trait is None],
+            dtype=np.int64
+        )
+        self.known = np.array(
+            [i for i, trait in enumerate(traits) if trait is not None],
+            dtype=np.int64
+        )
+        self.known_traits = np.array(
+            [traits[i] for i in self.known], dtype=bool
+        )
+
+        # gene counts of the first people in every block
+        numbers = np.arange(3 ** min(n, BLOCK_DIGITS))
+        self.pattern = np.array([
+            numbers // 3 ** i % 3 for i in range(min(n, BLOCK_DIGITS))
+        ], dtype=np.intp).reshape(-1, len(numbers))
+
+        # probability of every gene count and trait, genes * 2 + trait,
+        # without parents and for every gene count of the parents
+        gene_table = np.array([probs["gene"][copies] for copies in range(3)])
+        trait_table = np.array([
+            [probs["trait"][copies][False], probs["trait"][copies][True]]
+            for copies in range(3)
+        ])
+        mutation = probs["mutation"]
+        passing = np.array([mutation, 0.5, 1 - mutation])
+        mother = passing[:, None]
+        father = passing[None, :]
+        inherit = np.stack([
+            (1 - mother) * (1 - father),
+            mother * (1 - father) + father * (1 - mother),
+            mother * father
+        ], axis=-1)
+        self.founder_table = (gene_table[:, None] * trait_table).ravel()
+        self.child_table = (inherit[..., None] * trait_table).ravel()
+
+    def __len__(self):
+        return len(self.names)
+
+    def assignments(self):
+        """
+        Return the number of assignments of genes to everyone and of
+        traits to the people whose trait is unknown.
+        """
+        return 3 ** len(self) * 2 ** len(self.unknown)
+
+    def blocks(self):
+        """
+        Return the number of blocks the assignments are split into.
+        """
+        return self.assignments() // len(self.pattern[0])
+
+    def block(self, number):
+        """
+        Return the gene counts and traits of the assignments of block
+        `number`, as arrays with one row per person and one column per
+        assignment, plus an extra row of genes that are always 0.
+
+        Assignment `a` gives person i the i-th digit of `a` in base 3
+        as gene count, and the j-th person with an unknown trait the
+        j-th bit of `a // 3 ** len(self)` as trait. A block holds the
+        assignments with the same digits but the BLOCK_DIGITS lowest, so
+        those come from the same pattern in every block, and all the
+        other people have the same gene count and trait throughout.
+        """
+        n = len(self)
+        low = len(self.pattern)
+        genes = np.empty((n + 1, len(self.pattern[0])), dtype=np.intp)
+        genes[:low] = self.pattern
+        for i in range(low, n):
+            number, genes[i] = divmod(number, 3)
+        genes[n] = 0
+
+        traits = np.empty((n, len(genes[0])), dtype=np.intp)
+        traits[self.known] = self.known_traits[:, None]
+        for i in self.unknown:
+            number, traits[i] = divmod(number, 2)
+        return genes, traits
+
+
+def block_joint_probability(family, genes, traits):
+    """
+    Return the joint probability of every assignment in a block of
+    gene counts and traits, as returned by `Family.block`, computed
+    with one table lookup per person.
+    """
+    p = np.ones(genes.shape[1])
+    for i in range(len(family)):
+        outcome = genes[i] * 2 + traits[i]
+        if family.founders[i]:
+            p *= family.founder_table[outcome]
+        else:
+            parents = genes[family.mothers[i]] * 3 + genes[family.fathers[i]]
+            p *= family.child_table[parents * 6 + outcome]
+    return p
+
+
+def block_update(gene_totals, trait_totals, genes, traits, p):
+    """
+    Add the joint probabilities `p` of a block of assignments to the
+    N x 3 array of gene totals and the N x 2 array of trait totals.
+    """
+    for i in range(len(gene_totals)):
+        totals = np.bincount(genes[i] * 2 + traits[i], p, minlength=6)
+        totals = totals.reshape(3, 2)
+        gene_totals[i] += totals.sum(axis=1)
+        trait_totals[i] += totals.sum(axis=0)
+
+
+def enumerate_blocks(family, start=0, stop=None):
+    """
+    Add up the joint probabilities of the assignments in blocks `start`
+    to `stop` (all of them by default), and return the N x 3 array of
+    gene totals and the N x 2 array of trait totals.
+    """
+    if stop is None:
+        stop = family.blocks()
+    gene_totals = np.zeros((len(family), 3))
+    trait_totals = np.zeros((len(family), 2))
+    for number in range(start, stop):
+        genes, traits = family.block(number)
+        p = block_joint_probability(family, genes, traits)
+        block_update(gene_totals, trait_totals, genes, traits, p)
+    return gene_totals, trait_totals
+
+
+def parallel_enumerate_blocks(family, processes=None):
+    """
+    Return the gene and trait totals like `enumerate_blocks`, splitting
+    the blocks into shards of consecutive blocks enumerated in a pool of
+    `processes` worker processes (by default one per core).
+
+    Consecutive blocks share the gene counts of the people past the
+    BLOCK_DIGITS first, so each shard covers some of their gene
+    configurations. Workers return the totals of every block, which are
+    added up in block order exactly as `enumerate_blocks` does, so the
+    totals are bit for bit the same whatever the number of processes.
+    """
+    blocks = family.blocks()
+    shards = SHARDS_PER_PROCESS * (processes or os.cpu_count())
+    size = max(1, -(-blocks // shards))
+    tasks = [(start, min(start + size, blocks))
+             for start in range(0, blocks, size)]
+
+    gene_totals = np.zeros((len(family), 3))
+    trait_totals = np.zeros((len(family), 2))
+    with multiprocessing.Pool(processes, _init_enumerator, (family,)) as pool:
+        for gene_blocks, trait_blocks in pool.imap(_enumerate_worker, tasks):
+            for genes, traits in zip(gene_blocks, trait_blocks):
+                gene_totals += genes
+                trait_totals += traits
+    return gene_totals, trait_totals
+
+
+def _init_enumerator(family):
+    global worker_family
+    worker_family = family
+
+
+def _enumerate_worker(task):
+    """
+    Return the gene and trait totals of each block of a shard.
+    """
+    start, stop = task
+    n = len(worker_family)
+    gene_blocks = np.zeros((stop - start, n, 3))
+    trait_blocks = np.zeros((stop - start, n, 2))
+    for i, number in enumerate(range(start, stop)):
+        genes, traits = worker_family.block(number)
+        p = block_joint_probability(worker_family, genes, traits)
+        block_update(gene_blocks[i], trait_blocks[i], genes, traits, p)
+    return gene_blocks, trait_blocks
+
+
+def to_probabilities(family, gene_totals, trait_totals):
+    """
+    Return the totals in the format of the `probabilities` dictionary
+    of `heredity.main`, not yet normalized.
+    """
+    return {
+        person: {
+            "gene": {copies: float(gene_totals[i, copies])
+                     for copies in (2, 1, 0)},
+            "trait": {True: float(trait_totals[i, 1]),
+                      False: float(trait_totals[i, 0])}
+        }
+        for i, person in enumerate(family.names)
+    }
@@ -0,0 +1,414 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from linkgraph import LinkGraph
+
+DAMPING = 0.85
+
+# File the link graph of a generated corpus is saved to,
+# so that every engine starts from the same memory-mapped graph
+GRAPH_FILE = "links.graph"
+
+# Generated edge lists: a "# pages N" comment, then one
+# "source target" pair of page numbers per line
+EDGES_FILE = "edges.txt"
+
+# Ways of computing the link graph or the ranks, by name:
+# the kind of result they produce and the keyword arguments they run with
+ENGINES = {
+    "crawl": ("graph", {}),
+    "parallel-crawl": ("graph", {}),
+    "sample": ("sample", {}),
+    "parallel-sample": ("sample", {"walkers": 8}),
+    "power": ("iterate", {"method": "power"}),
+    "gauss-seidel": ("iterate", {"method": "gauss-seidel"}),
+    "aitken": ("iterate", {"method": "power", "extrapolation": "aitken"}),
+    "quadratic": (
+        "iterate", {"method": "power", "extrapolation": "quadratic"}
+    )
+}
+
+# Most links generated on a single page
+MAX_LINKS = 1000
+
+PAGE = """<!DOCTYPE html>
+<html lang="en">
+    <head>
+        <title>{name}</title>
+    </head>
+    <body>
+        <h1>{name}</h1>
+
+        <div>Links:</div>
+        <ul>
+{links}
+        </ul>
+    </body>
+</html>
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark PageRank on a synthetic power-law web graph."
+    )
+    parser.add_argument("directory",
+                        help="corpus directory, generated if missing")
+    parser.add_argument("--pages", type=int, default=10 ** 4,
+                        help="number of pages to generate")
+    parser.add_argument("--links", type=float, default=8,
+                        help="average number of links per page")
+    parser.add_argument("--format", choices=["html", "edges"], default="html",
+                        help="generate HTML pages, or an edge list for "
+                             "graphs too large to crawl")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--samples", type=int, default=10 ** 6,
+                        help="number of pages sampled by the random surfer")
+    parser.add_argument("--tolerance", type=float, default=1e-8,
+                        help="L1 residual the iterative engines stop at")
+    parser.add_argument("--agreement", type=float, default=1e-6,
+                        help="largest L1 distance allowed between the "
+                             "iterative engines")
+    parser.add_argument("--sample-agreement", type=float, default=0.01,
+                        help="largest difference of any rank allowed "
+                             "between sampling and iteration")
+    parser.add_argument("--engines", nargs="+", choices=list(ENGINES),
+                        default=list(ENGINES))
+    parser.add_argument("--save", metavar="FILE",
+                        help="write the results to FILE as JSON")
+    parser.add_argument("--baseline", metavar="FILE",
+                        help="compare against results saved with --save")
+    parser.add_argument("--slowdown", type=float, default=0.2,
+                        help="allowed slowdown against the baseline")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        print(f"Generating {args.pages} pages in {args.directory}...")
+        generate(args.directory, args.pages, args.links, args.format,
+                 args.seed)
+    prepare(args.directory)
+
+    results = {}
+    ranks = {}
+    for name in args.engines:
+        if ENGINES[name][0] == "graph" and not has_html(args.directory):
+            print(f"{name}: skipped, the corpus has no HTML pages")
+            continue
+        results[name], ranks[name] = run_isolated(args.directory, name, args)
+        print_result(name, results[name])
+
+    failures = check_agreement(results, ranks, args.agreement,
+                               args.sample_agreement)
+    for name, result in results.items():
+        if "l1_distance" in result:
+            print(f"{name}: L1 distance {result['l1_distance']:.2e}, "
+                  f"largest difference {result['max_difference']:.2e}")
+    for failure in failures:
+        print(f"Disagreement: {failure}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.slowdown)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+
+    if failures or regressions:
+        sys.exit(1)
+
+
+def generate(directory, n, links=8, output="html", seed=0):
+    """
+    Write a corpus of `n` pages with about `links` links each into
+    `directory`, as HTML pages or as an edge list.
+
+    Both the number of links out of a page and the popularity of the
+    pages they point to follow power laws, as on the web: most pages
+    have a few links, some have none or hundreds, and a few hubs are
+    linked to by a large share of all pages.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+
+    # one page in ten is left without links, and the others get
+    # power-law out-degrees whose mean over all pages is `links`
+    most = min(n - 1, MAX_LINKS)
+    linked = rng.random(n) >= 0.1
+    degrees = np.zeros(n, dtype=np.int64)
+    degree_weights = _degree_weights(links * n / max(linked.sum(), 1), most)
+    degrees[linked] = 1 + rng.choice(most, int(linked.sum()),
+                                     p=degree_weights)
+
+    # the k-th most popular page, in a random order of pages,
+    # is linked to in proportion to 1 / k
+    popularity = rng.permutation(n)
+    weights = 1 / np.arange(1, n + 1)
+    weights /= weights.sum()
+    sources = np.repeat(np.arange(n), degrees)
+    targets = popularity[rng.choice(n, len(sources), p=weights)]
+
+    # links repeated on a page or to the page itself are drawn again,
+    # so every page has as many distinct links as its degree
+    while True:
+        _, first = np.unique(sources * n + targets, return_index=True)
+        redraw = np.ones(len(targets), dtype=bool)
+        redraw[first] = False
+        redraw |= sources == targets
+        if not redraw.any():
+            break
+        targets[redraw] = popularity[
+            rng.choice(n, int(redraw.sum()), p=weights)
+        ]
+
+    if output == "edges":
+        np.savetxt(os.path.join(directory, EDGES_FILE),
+                   np.column_stack([sources, targets]), fmt="%d",
+                   header=f"pages {n}")
+        return
+
+    offsets = np.concatenate([[0], np.cumsum(degrees)])
+    for page in range(n):
+        items = "\n".join(
+            f'            <li><a href="{target}.html">{target}</a></li>'
+            for target in targets[offsets[page]:offsets[page + 1]]
+        )
+        with open(os.path.join(directory, f"{page}.html"), "w") as f:
+            f.write(PAGE.format(name=page, links=items))
+
+
+def _degree_weights(mean, most):
+    """
+    Return the probabilities of degrees 1 to `most` in a power law
+    whose exponent is chosen so that the mean degree is `mean`, or as
+    close to it as the bounds allow.
+    """
+    degrees = np.arange(1, most + 1)
+
+    def weights(exponent):
+        weights = degrees ** -exponent
+        return weights / weights.sum()
+
+    # the mean falls as the exponent grows, so bisect on the exponent
+    low, high = 0.0, 10.0
+    for _ in range(60):
+        exponent = (low + high) / 2
+        if weights(exponent) @ degrees > mean:
+            low = exponent
+        else:
+            high = exponent
+    return weights((low + high) / 2)
+
+
+def has_html(directory):
+    return not os.path.exists(os.path.join(directory, EDGES_FILE))
+
+
+def prepare(directory):
+    """
+    Save the link graph of the corpus in `directory` to GRAPH_FILE,
+    crawling the HTML pages or reading the edge list, unless it is
+    already there.
+    """
+    filename = os.path.join(directory, GRAPH_FILE)
+    if os.path.exists(filename):
+        return
+    if has_html(directory):
+        from pagerank import parallel_crawl
+        graph = parallel_crawl(directory)
+    else:
+        graph = read_edges(os.path.join(directory, EDGES_FILE))
+    graph.save(filename)
+
+
+def read_edges(filename):
+    """
+    Build a link graph from an edge list written by `generate`, naming page
+    `i` "i.html" and dropping repeated links and links to the page itself.
+    """
+    with open(filename) as f:
+        n = int(f.readline().split()[-1])
+    edges = np.loadtxt(filename, dtype=np.int64, ndmin=2)
+    edges = edges[edges[:, 0] != edges[:, 1]]
+    edges = np.unique(edges, axis=0)
+
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(edges[:, 0], minlength=n), out=offsets[1:])
+    pages = [f"{i}.html" for i in range(n)]
+    return LinkGraph(pages, offsets, edges[:, 1].astype(np.int32))
+
+
+def run_isolated(directory, name, args):
+    """
+    Runs one engine in a fresh process,
+    so that its time and peak memory are its own.
+    """
+    # executor workers, unlike pool workers, may start processes
+    # of their own for the parallel engines
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(1, mp_context=context) as executor:
+        return executor.submit(run, directory, name, vars(args)).result()
+
+
+def run(directory, name, options):
+    """
+    Runs one engine on the corpus and returns its measurements,
+    and its ranks in the order of the sorted page names.
+    """
+    import pagerank
+
+    kind, kwargs = ENGINES[name]
+    result = {"kind": kind}
+
+    start = time.perf_counter()
+    graph, _ = LinkGraph.load(os.path.join(directory, GRAPH_FILE))
+    result["load_seconds"] = time.perf_counter() - start
+    result["pages"] = len(graph)
+    result["links"] = len(graph.targets)
+
+    start = time.perf_counter()
+    if kind == "graph":
+        if name == "crawl":
+            corpus = pagerank.crawl(directory)
+            links = sum(len(corpus[page]) for page in corpus)
+        else:
+            crawled = pagerank.parallel_crawl(directory)
+            corpus, links = crawled.pages, len(crawled.targets)
+        result["seconds"] = time.perf_counter() - start
+        result["crawled_pages"] = len(corpus)
+        result["crawled_links"] = links
+        result["peak_rss_mb"] = peak_rss_mb()
+        return result, None
+
+    if kind == "sample":
+        samples = options["samples"]
+        if "walkers" in kwargs:
+            ranks, _ = pagerank.parallel_sample_pagerank(
+                graph, DAMPING, samples, kwargs["walkers"],
+                seed=options["seed"]
+            )
+        else:
+            ranks = pagerank.sample_pagerank(graph, DAMPING, samples,
+                                             seed=options["seed"])
+        result["seconds"] = time.perf_counter() - start
+    else:
+        residuals = []
+        ranks = pagerank.iterate_pagerank(
+            graph, DAMPING, tolerance=options["tolerance"], norm="l1",
+            callback=lambda i, residual, _: residuals.append(residual),
+            **kwargs
+        )
+        result["seconds"] = time.perf_counter() - start
+        result["iterations"] = len(residuals)
+        result["residual"] = float(residuals[-1])
+
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result, np.array([ranks[page] for page in sorted(ranks)])
+
+
+def check_agreement(results, ranks, agreement, sample_agreement):
+    """
+    Returns descriptions of the engines whose results differ from the
+    first engine of the same kind: crawls finding another graph,
+    iterations further than `agreement` apart in L1 distance, and
+    samples with any rank further than `sample_agreement` from the
+    first iteration.
+    """
+    failures = []
+    crawls = [name for name in results if results[name]["kind"] == "graph"]
+    for name in crawls:
+        result = results[name]
+        found = (result["crawled_pages"], result["crawled_links"])
+        if found != (result["pages"], result["links"]):
+            failures.append(
+                f"{name} crawled {found[0]} pages and {found[1]} links, "
+                f"expected {result['pages']} and {result['links']}"
+            )
+
+    iterations = [
+        name for name in results if results[name]["kind"] == "iterate"
+    ]
+    if not iterations:
+        return failures
+    reference = ranks[iterations[0]]
+
+    for name in results:
+        kind = results[name]["kind"]
+        if kind == "graph":
+            continue
+        difference = np.abs(ranks[name] - reference)
+        results[name]["l1_distance"] = float(difference.sum())
+        results[name]["max_difference"] = float(difference.max())
+        if kind == "iterate" and difference.sum() > agreement:
+            failures.append(f"{name} is {difference.sum():.2e} away from "
+                            f"{iterations[0]} in L1 distance")
+        if kind == "sample" and difference.max() > sample_agreement:
+            failures.append(f"{name} has a rank {difference.max():.4f} away "
+                            f"from {iterations[0]}")
+    return failures
+
+
+def peak_rss_mb():
+    """
+    Returns the peak resident memory of this process in megabytes,
+    or None where the resource module is not available.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is in kilobytes, except on macOS where it is in bytes
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def print_result(name, result):
+    memory = result["peak_rss_mb"]
+    print(f"{name}:")
+    print(f"  graph: {result['pages']} pages, {result['links']} links, "
+          f"loaded in {result['load_seconds']:.2f}s")
+    print(f"  time: {result['seconds']:.3f}s")
+    if "iterations" in result:
+        print(f"  iterations: {result['iterations']}, "
+              f"residual {result['residual']:.2e}")
+    if memory is not None:
+        print(f"  peak memory: {memory:.1f} MB")
+
+
+def compare(baseline, results, slowdown):
+    """
+    Returns descriptions of the engines that are slower than
+    `baseline` by more than `slowdown`, or take more iterations.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]
+        if result["seconds"] > before["seconds"] * (1 + slowdown):
+            regressions.append(f"{name} seconds {before['seconds']:.3f} "
+                               f"-> {result['seconds']:.3f}")
+        if result.get("iterations", 0) > before.get("iterations", 0):
+            regressions.append(f"{name} iterations {before['iterations']} "
+                               f"-> {result['iterations']}")
+    return regressions
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,587 @@
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+# First bytes of a link graph file written by LinkGraph.save
+MAGIC = b"LINKGRF1"
+
+# Pages updated together by each step of a Gauss-Seidel sweep
+GAUSS_SEIDEL_BLOCK = 256
+
+# Sweeps between two extrapolations of the ranks, doubled each time
+# an extrapolation is rejected
+EXTRAPOLATE_EVERY = 10
+
+# Number of random numbers drawn at once by sample_counts
+SAMPLE_BLOCK = 65536
+
+# Link graph sampled by each worker process of parallel_sample_counts
+worker_graph = None
+
+
+class LinkGraph():
+    """
+    Link graph of a corpus over dense page indexes, in CSR form:
+    the pages linked to by page `i` are
+    `targets[offsets[i]:offsets[i + 1]]`.
+    """
+
+    def __init__(self, pages, offsets, targets):
+        self.pages = pages
+        self.offsets = offsets
+        self.targets = targets
+
+        self.degrees = np.diff(offsets)
+        self.dangling = self.degrees == 0
+
+        # page of every link, and the share of its rank the link carries
+        self.sources = np.repeat(
+            np.arange(len(pages), dtype=np.int32), self.degrees
+        )
+        self.shares = np.zeros(len(pages))
+        np.divide(1, self.degrees, out=self.shares, where=~self.dangling)
+
+        # links sorted by target, built on first use by Gauss-Seidel
+        self._incoming = None
+
+    @classmethod
+    def from_corpus(cls, corpus):
+        """
+        Build a link graph from a corpus dictionary as returned by `crawl`,
+        with pages in sorted order.
+        """
+        pages = sorted(corpus)
+        index = {page: i for i, page in enumerate(pages)}
+        offsets = np.zeros(len(pages) + 1, dtype=np.int64)
+        targets = []
+        for i, page in enumerate(pages):
+            links = sorted(index[link] for link in corpus[page])
+            targets.extend(links)
+            offsets[i + 1] = offsets[i] + len(links)
+        return cls(pages, offsets, np.array(targets, dtype=np.int32))
+
+    @classmethod
+    def from_links(cls, pages, links):
+        """
+        Build a link graph from the page names and, for every page in
+        the same order, an array of the indexes of the pages it links to.
+        """
+        offsets = np.zeros(len(pages) + 1, dtype=np.int64)
+        np.cumsum([len(targets) for targets in links], out=offsets[1:])
+        if links:
+            targets = np.concatenate(links).astype(np.int32, copy=False)
+        else:
+            targets = np.zeros(0, dtype=np.int32)
+        return cls(pages, offsets, targets)
+
+    def save(self, filename, stamp=(0, 0, 0)):
+        """
+        Write the graph to a single binary file: a header with the
+        sizes and three integers identifying the source (`stamp`),
+        the int64 offsets, the int32 targets and the page names.
+
+        The file is written next to `filename` and then moved over it,
+        so an interrupted save never leaves a partial graph behind.
+        """
+        names = "\n".join(self.pages).encode("utf-8")
+        header = np.array(
+            [len(self.pages), len(self.targets), len(names), *stamp],
+            dtype=np.int64
+        )
+        partial = f"{filename}.tmp"
+        with open(partial, "wb") as f:
+            f.write(MAGIC)
+            f.write(header.tobytes())
+            f.write(np.asarray(self.offsets, dtype=np.int64).tobytes())
+            f.write(np.asarray(self.targets, dtype=np.int32).tobytes())
+            f.write(names)
+        os.replace(partial, filename)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Memory-map a graph written by `save`. Return the graph and its
+        stamp, or None and None if the file is missing, not a graph or
+        not as long as its header says.
+        """
+        try:
+            data = np.memmap(filename, dtype=np.uint8, mode="r")
+        except (OSError, ValueError):
+            return None, None
+        start = len(MAGIC)
+        if len(data) < start + 48 or data[:start].tobytes() != MAGIC:
+            return None, None
+
+        header = data[start:start + 48].view(np.int64)
+        pages, links, names = (int(value) for value in header[:3])
+        stamp = tuple(int(value) for value in header[3:])
+        if min(pages, links, names) < 0 or len(data) != (
+            start + 48 + 8 * (pages + 1) + 4 * links + names
+        ):
+            return None, None
+
+        start += 48
+        offsets = data[start:start + 8 * (pages + 1)].view(np.int64)
+        start += 8 * (pages + 1)
+        targets = data[start:start + 4 * links].view(np.int32)
+        start += 4 * links
+        names = data[start:start + names].tobytes().decode("utf-8")
+
+        return cls(names.split("\n") if pages else [], offsets, targets), stamp
+
+    def __len__(self):
+        return len(self.pages)
+
+    def propagate(self, ranks):
+        """
+        Returns, for every page, the rank flowing into it along links
+        from pages with `ranks`, plus an equal share of the rank of
+        every page without links, which links to all pages.
+        """
+        weights = ranks[self.sources] * self.shares[self.sources]
+        flow = np.bincount(self.targets, weights, minlength=len(self))
+        return flow + ranks[self.dangling].sum() / len(self)
+
+    def propagate_many(self, ranks):
+        """
+        Returns, for every page and every column of the N x K matrix
+        `ranks`, the rank flowing into the page along links, without
+        the rank of pages without links, in one sparse-dense product.
+        """
+        k = ranks.shape[1]
+        weights = ranks[self.sources] * self.shares[self.sources, None]
+        cells = self.targets[:, None] * k + np.arange(k)
+        flow = np.bincount(cells.ravel(), weights.ravel(),
+                           minlength=len(self) * k)
+        return flow.reshape(len(self), k)
+
+    def incoming(self):
+        """
+        Return the links sorted by the page they point to, as CSR
+        offsets over target pages, with the source and target of each.
+        """
+        if self._incoming is None:
+            order = np.argsort(self.targets, kind="stable")
+            offsets = np.zeros(len(self) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.targets, minlength=len(self)),
+                      out=offsets[1:])
+            self._incoming = (
+                offsets, self.sources[order],
+                np.asarray(self.targets)[order]
+            )
+        return self._incoming
+
+    def ranks_dict(self, ranks):
+        """
+        Returns a dictionary mapping every page name to its rank.
+        """
+        return dict(zip(self.pages, ranks.tolist()))
+
+
+def as_link_graph(corpus):
+    """
+    Return `corpus` if it is already a link graph,
+    else build one from the corpus dictionary.
+    """
+    if isinstance(corpus, LinkGraph):
+        return corpus
+    return LinkGraph.from_corpus(corpus)
+
+
+def power_iteration(graph, damping_factor, tolerance=0.001, start=None,
+                    info=None, norm="max", method="power",
+                    extrapolation=None, callback=None):
+    """
+    Return the PageRank vector of `graph`, starting from `start`
+    (1 / N for every page by default) and applying the PageRank formula
+    until the residual, the change between two sweeps, is below
+    `tolerance`.
+
+    `norm` is "max" for the largest change of any rank, or "l1" for the
+    sum of all changes. `method` is "power", which updates all pages at
+    once from the previous ranks, or "gauss-seidel", which updates
+    blocks of pages in turn, each using the ranks already updated
+    during the sweep. `extrapolation` is None, "aitken" or "quadratic",
+    and is tried every EXTRAPOLATE_EVERY sweeps to jump closer to the
+    limit of the sequence of ranks. An extrapolation only helps when
+    the error is dominated by a few directions, as when groups of pages
+    link only among themselves, so it is kept only if the next sweep
+    changes the ranks less than the sweep before it.
+
+    `callback`, if given, is called after every sweep with the number
+    of sweeps so far, the residual and the seconds elapsed. If `info` is
+    a dictionary, the number of "iterations", the list of "residuals"
+    and the total "seconds" are stored in it.
+    """
+    sweeps = {"power": _power_sweep, "gauss-seidel": _gauss_seidel_sweep}
+    extrapolations = {
+        None: (0, None), "aitken": (3, _aitken), "quadratic": (4, _quadratic)
+    }
+    if method not in sweeps:
+        raise ValueError(f"unknown method: {method}")
+    if extrapolation not in extrapolations:
+        raise ValueError(f"unknown extrapolation: {extrapolation}")
+    if norm not in ("max", "l1"):
+        raise ValueError(f"unknown norm: {norm}")
+    sweep = sweeps[method]
+    needed, extrapolate = extrapolations[extrapolation]
+
+    n = len(graph)
+    ranks = np.full(n, 1 / n) if start is None else np.array(start, float)
+    history = [ranks]
+    residuals = []
+    began = time.perf_counter()
+    every = EXTRAPOLATE_EVERY
+    next_extrapolation = every
+
+    def measure(old, new):
+        change = np.abs(new - old)
+        residual = change.max() if norm == "max" else change.sum()
+        residuals.append(residual)
+        if callback is not None:
+            callback(len(residuals), residual, time.perf_counter() - began)
+        return residual
+
+    while True:
+        new_ranks = sweep(graph, damping_factor, ranks)
+        residual = measure(ranks, new_ranks)
+        ranks = new_ranks
+        if residual < tolerance:
+            break
+        if not needed:
+            continue
+
+        history = history[-(needed - 1):] + [ranks]
+        if len(history) < needed or len(residuals) < next_extrapolation:
+            continue
+
+        # an extrapolation is kept only if the sweep from it changes the
+        # ranks less than the last sweep did, else that sweep is thrown
+        # away and extrapolation is tried half as often
+        candidate = extrapolate(history)
+        trial = sweep(graph, damping_factor, candidate)
+        trial_residual = measure(candidate, trial)
+        if trial_residual < residual:
+            ranks = trial
+            history = [candidate, trial]
+            if trial_residual < tolerance:
+                break
+        else:
+            every *= 2
+            history = [ranks]
+        next_extrapolation = len(residuals) + every
+
+    if info is not None:
+        info["iterations"] = len(residuals)
+        info["residuals"] = residuals
+        info["seconds"] = time.perf_counter() - began
+    return ranks
+
+
+def _power_sweep(graph, damping_factor, ranks):
+    flow = graph.propagate(ranks)
+    return (1 - damping_factor) / len(graph) + damping_factor * flow
+
+
+def _gauss_seidel_sweep(graph, damping_factor, ranks):
+    """
+    Update the ranks one block of GAUSS_SEIDEL_BLOCK pages at a time,
+    each block using the ranks of the blocks before it from this sweep,
+    then scale them back to a sum of 1.
+    """
+    n = len(graph)
+    offsets, sources, targets = graph.incoming()
+    ranks = ranks.copy()
+    dangling = graph.dangling
+    dangling_mass = ranks[dangling].sum()
+
+    for start in range(0, n, GAUSS_SEIDEL_BLOCK):
+        end = min(start + GAUSS_SEIDEL_BLOCK, n)
+        links = slice(offsets[start], offsets[end])
+        weights = ranks[sources[links]] * graph.shares[sources[links]]
+        flow = np.bincount(targets[links] - start, weights,
+                           minlength=end - start)
+        new = (1 - damping_factor) / n + damping_factor * (
+            flow + dangling_mass / n
+        )
+
+        block_dangling = dangling[start:end]
+        dangling_mass += (
+            new[block_dangling] - ranks[start:end][block_dangling]
+        ).sum()
+        ranks[start:end] = new
+
+    # the ranks no longer sum to 1 in the middle of a sweep, and left
+    # alone that error decays more slowly than the rest
+    return ranks / ranks.sum()
+
+
+def _aitken(history):
+    """
+    Aitken's delta-squared extrapolation of each rank from the last
+    three iterates, keeping the latest rank where it is ill-defined.
+    """
+    x0, x1, x2 = history
+    denominator = x2 - 2 * x1 + x0
+    safe = np.abs(denominator) > 1e-15
+    ranks = x2.copy()
+    ranks[safe] = x2[safe] - (x2[safe] - x1[safe]) ** 2 / denominator[safe]
+    return _renormalize(ranks, x2)
+
+
+def _quadratic(history):
+    """
+    Quadratic extrapolation (Kamvar et al.) from the last four iterates,
+    which removes the two next largest eigenvectors from the error.
+    """
+    x0, x1, x2, x3 = history
+    y = np.column_stack([x1 - x0, x2 - x0])
+    gamma, *_ = np.linalg.lstsq(y, -(x3 - x0), rcond=None)
+    gamma1, gamma2 = gamma
+    gamma3 = 1
+    beta0 = gamma1 + gamma2 + gamma3
+    beta1 = gamma2 + gamma3
+    beta2 = gamma3
+    return _renormalize(beta0 * x1 + beta1 * x2 + beta2 * x3, x3)
+
+
+def _renormalize(ranks, fallback):
+    """
+    Make extrapolated ranks a distribution again, falling back to the
+    latest iterate if extrapolation broke down.
+    """
+    ranks = np.clip(ranks, 0, None)
+    total = ranks.sum()
+    if not np.isfinite(total) or total <= 0:
+        return fallback
+    return ranks / total
+
+
+def teleport_matrix(graph, seed_sets):
+    """
+    Return the N x K matrix whose column k teleports uniformly to the
+    pages of `seed_sets[k]`, a collection of page names.
+    """
+    index = {page: i for i, page in enumerate(graph.pages)}
+    teleport = np.zeros((len(graph), len(seed_sets)))
+    for k, seeds in enumerate(seed_sets):
+        unknown = set(seeds) - index.keys()
+        if unknown:
+            raise ValueError(f"unknown pages: {', '.join(sorted(unknown))}")
+        rows = [index[page] for page in set(seeds)]
+        if not rows:
+            raise ValueError(f"seed set {k} is empty")
+        teleport[rows, k] = 1 / len(rows)
+    return teleport
+
+
+def personalized_iteration(graph, damping_factor, teleport, tolerance=0.001,
+                           norm="max", info=None):
+    """
+    Return the N x K matrix of personalized PageRank vectors of `graph`,
+    one for each column of the N x K matrix `teleport`, where the random
+    surfer jumps to page i of column k with probability teleport[i, k]
+    instead of uniformly. Pages without links also hand their rank to
+    the pages of the teleport vector.
+
+    All columns are updated together until none changes by `tolerance`
+    or more, measured as in `power_iteration`. If `info` is a
+    dictionary, the number of "iterations" is stored in it.
+
+    Raises ValueError if `teleport` has a negative or non-finite entry,
+    or a column that does not sum to a positive number.
+    """
+    if norm not in ("max", "l1"):
+        raise ValueError(f"unknown norm: {norm}")
+    teleport = np.asarray(teleport, dtype=float)
+    if teleport.ndim != 2 or teleport.shape[0] != len(graph):
+        raise ValueError("teleport must have one row per page")
+    if not np.isfinite(teleport).all() or (teleport < 0).any():
+        raise ValueError("teleport entries must be finite and non-negative")
+    totals = teleport.sum(axis=0)
+    empty = np.flatnonzero(~(np.isfinite(totals) & (totals > 0)))
+    if len(empty):
+        raise ValueError(f"teleport column {empty[0]} has no positive entry")
+    teleport = teleport / totals
+
+    ranks = teleport.copy()
+    iterations = 0
+    while True:
+        flow = graph.propagate_many(ranks)
+        flow += teleport * ranks[graph.dangling].sum(axis=0)
+        new_ranks = (1 - damping_factor) * teleport + damping_factor * flow
+        change = np.abs(new_ranks - ranks)
+        residual = (change.max(axis=0) if norm == "max"
+                    else change.sum(axis=0)).max()
+        ranks = new_ranks
+        iterations += 1
+        if not np.isfinite(residual):
+            raise FloatingPointError(
+                f"personalized ranks diverged after {iterations} iterations"
+            )
+        if residual < tolerance:
+            if info is not None:
+                info["iterations"] = iterations
+            return ranks
+
+
+def save_ranks(filename, graph, ranks):
+    """
+    Save a link graph and its ranks to `filename` in .npz format,
+    to warm-start a later run.
+    """
+
+    # through a file object, so that np.savez does not add .npz to the name
+    with open(filename, "wb") as f:
+        np.savez(f, pages=np.array(graph.pages), offsets=graph.offsets,
+                 targets=graph.targets, ranks=ranks)
+
+
+def load_ranks(filename):
+    """
+    Load a link graph and its ranks saved by `save_ranks`.
+    """
+    with np.load(filename) as data:
+        graph = LinkGraph(data["pages"].tolist(), data["offsets"],
+                          data["targets"])
+        return graph, data["ranks"]
+
+
+def diff_graphs(old, new):
+    """
+    Compare two link graphs by page name. Return a dictionary of the
+    pages "added" to and "removed" from `new`, and of the pages in both
+    whose links "changed".
+    """
+    new_index = {page: i for i, page in enumerate(new.pages)}
+    old_pages = set(old.pages)
+
+    # new index of every old page, or -1 for removed pages
+    remap = np.array(
+        [new_index.get(page, -1) for page in old.pages], dtype=np.int64
+    )
+
+    added = [page for page in new.pages if page not in old_pages]
+    removed = [page for page in old.pages if page not in new_index]
+    changed = []
+    for j, page in enumerate(old.pages):
+        i = remap[j]
+        if i == -1:
+            continue
+        old_links = remap[old.targets[old.offsets[j]:old.offsets[j + 1]]]
+        new_links = new.targets[new.offsets[i]:new.offsets[i + 1]]
+        if len(old_links) != len(new_links) or not np.array_equal(
+            np.sort(old_links), np.sort(new_links)
+        ):
+            changed.append(page)
+
+    return {"added": added, "removed": removed, "changed": changed}
+
+
+def warm_start(old, old_ranks, new):
+    """
+    Return a starting rank vector for `new` that keeps the ranks of
+    pages also in `old`, gives new pages 1 / N, and sums to 1.
+    """
+    old_index = {page: i for i, page in enumerate(old.pages)}
+    start = np.full(len(new), 1 / len(new))
+    for i, page in enumerate(new.pages):
+        if page in old_index:
+            start[i] = old_ranks[old_index[page]]
+    return start / start.sum()
+
+
+def sample_counts(graph, damping_factor, n, rng):
+    """
+    Return how many times a random surfer visits each page of `graph`
+    in `n` samples, starting from a page chosen at random.
+
+    The transition model of every page is a mix of two uniform choices,
+    one among its links and one among all pages, so each step is drawn
+    in constant time from the CSR arrays instead of building a
+    distribution. Random numbers are generated in blocks with `rng`,
+    a numpy Generator.
+    """
+    size = len(graph)
+    offsets = graph.offsets.tolist()
+    targets = graph.targets.tolist()
+    degrees = graph.degrees.tolist()
+    counts = [0] * size
+
+    page = int(rng.integers(size))
+    counts[page] += 1
+
+    remaining = n - 1
+    while remaining > 0:
+        block = min(remaining, SAMPLE_BLOCK)
+        follows = (rng.random(block) < damping_factor).tolist()
+        picks = rng.random(block).tolist()
+
+        for follow, pick in zip(follows, picks):
+            degree = degrees[page]
+            if follow and degree:
+                page = targets[offsets[page] + int(pick * degree)]
+            else:
+                page = int(pick * size)
+            counts[page] += 1
+
+        remaining -= block
+
+    return np.array(counts)
+
+
+def parallel_sample_counts(graph, damping_factor, n, walkers,
+                           processes=None, seed=None):
+    """
+    Return a (walkers, pages) array of visit counts from `walkers`
+    independent random surfers sharing `n` samples, run across a pool
+    of `processes` worker processes (by default one per core).
+
+    Each walker draws from its own random stream spawned from `seed`,
+    so the counts only depend on `seed` and `walkers`, not on how the
+    walkers are spread over processes.
+    """
+    streams = np.random.SeedSequence(seed).spawn(walkers)
+    samples = [
+        n // walkers + (1 if i < n % walkers else 0) for i in range(walkers)
+    ]
+    tasks = [
+        (damping_factor, count, stream)
+        for count, stream in zip(samples, streams)
+    ]
+    with multiprocessing.Pool(processes, _init_sampler,
+                              (graph.pages, graph.offsets, graph.targets)) \
+            as pool:
+        return np.array(pool.map(_sample_worker, tasks))
+
+
+def confidence_intervals(counts, z=1.96):
+    """
+    Return the pooled rank estimate of every page from per-walker
+    `counts`, and the half-width of its confidence interval (95% by
+    default) from the spread of the walkers' own estimates. Walkers
+    without any samples are left out of the spread.
+    """
+    samples = counts.sum(axis=1)
+    ranks = counts.sum(axis=0) / samples.sum()
+    counts = counts[samples > 0]
+    estimates = counts / samples[samples > 0, None]
+    if len(counts) < 2:
+        return ranks, np.full(len(ranks), np.nan)
+    errors = estimates.std(axis=0, ddof=1) / np.sqrt(len(counts))
+    return ranks, z * errors
+
+
+def _init_sampler(pages, offsets, targets):
+    global worker_graph
+    worker_graph = LinkGraph(pages, offsets, targets)
+
+
+def _sample_worker(task):
+    damping_factor, n, stream = task
+    if n == 0:
+        return np.zeros(len(worker_graph), dtype=np.int64)
+    rng = np.random.default_rng(stream)
+    return sample_counts(worker_graph, damping_factor, n, rng)
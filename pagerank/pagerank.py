@@ -1,24 +1,138 @@
+import argparse
+import multiprocessing
 import os
-import random
 import re
-import sys
+import time
+
+import numpy as np
+
+from linkgraph import (
+    LinkGraph, as_link_graph, confidence_intervals, diff_graphs, load_ranks,
+    parallel_sample_counts, personalized_iteration, power_iteration,
+    sample_counts, save_ranks, teleport_matrix, warm_start
+)
 
 DAMPING = 0.85
 SAMPLES = 10000
 
+# Links extracted from the HTML of every page
+LINK = re.compile(r"<a\s+(?:[^>]*?)href=\"([^\"]*)\"")
+
+# Characters read at a time by parallel_crawl, and the most it carries
+# over from one chunk to the next while waiting for a tag to close
+CHUNK_SIZE = 1 << 16
+MAX_CARRY = 1 << 16
+
+# Page names indexed by each worker process of parallel_crawl
+worker_pages = None
+
 
 def main():
-    if len(sys.argv) != 2:
-        sys.exit("Usage: python pagerank.py corpus")
-    corpus = crawl(sys.argv[1])
-    ranks = sample_pagerank(corpus, DAMPING, SAMPLES)
-    print(f"PageRank Results from Sampling (n = {SAMPLES})")
-    for page in sorted(ranks):
-        print(f"  {page}: {ranks[page]:.4f}")
-    ranks = iterate_pagerank(corpus, DAMPING)
-    print(f"PageRank Results from Iteration")
+    parser = argparse.ArgumentParser(description="Rank web pages.")
+    parser.add_argument("corpus")
+    parser.add_argument("--samples", type=int, default=SAMPLES,
+                        help="number of pages sampled by the random surfer")
+    parser.add_argument("--walkers", type=int, default=1,
+                        help="split sampling across independent surfers "
+                             "and report confidence intervals")
+    parser.add_argument("--processes", type=int,
+                        help="worker processes for the walkers "
+                             "(default: one per core)")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--crawl-workers", type=int,
+                        help="parse pages in a pool of worker processes")
+    parser.add_argument("--graph-cache", metavar="FILE",
+                        help="load the link graph from FILE instead of "
+                             "crawling while the corpus is unchanged")
+    parser.add_argument("--tolerance", type=float, default=0.001,
+                        help="stop iterating once the ranks change by less")
+    parser.add_argument("--norm", choices=["max", "l1"], default="max",
+                        help="measure the change as the largest change of "
+                             "any rank, or the sum of all changes")
+    parser.add_argument("--method", choices=["power", "gauss-seidel"],
+                        default="power")
+    parser.add_argument("--extrapolation", choices=["aitken", "quadratic"],
+                        help="periodically extrapolate the ranks")
+    parser.add_argument("--verbose", action="store_true",
+                        help="print the residual and time of every sweep")
+    parser.add_argument("--topic", action="append", default=[],
+                        metavar="PAGE[,PAGE...]",
+                        help="also rank pages for a surfer jumping only to "
+                             "these pages (may be repeated)")
+    parser.add_argument("--state", metavar="FILE",
+                        help="warm-start iteration from the ranks saved in "
+                             "FILE by the previous run, then save them")
+    args = parser.parse_args()
+    if args.walkers > args.samples:
+        parser.error("--walkers cannot exceed --samples")
+
+    if args.graph_cache:
+        corpus = load_corpus(args.corpus, args.graph_cache,
+                             workers=args.crawl_workers)
+    elif args.crawl_workers:
+        info = {}
+        corpus = parallel_crawl(args.corpus, args.crawl_workers, info=info)
+        print(f"Crawled {info['pages']} pages in {info['seconds']:.2f}s "
+              f"({info['pages_per_second']:.0f} pages/s)")
+    else:
+        corpus = crawl(args.corpus)
+
+    # topics are checked before any ranking is printed
+    topics = {topic: topic.split(",") for topic in args.topic}
+    pages = corpus.pages if isinstance(corpus, LinkGraph) else corpus
+    for topic, seeds in topics.items():
+        unknown = sorted(set(seeds).difference(pages))
+        if unknown:
+            parser.error(f"--topic {topic}: unknown pages: "
+                         f"{', '.join(unknown)}")
+
+    if args.walkers > 1:
+        ranks, intervals = parallel_sample_pagerank(
+            corpus, DAMPING, args.samples, args.walkers,
+            processes=args.processes, seed=args.seed
+        )
+        print(f"PageRank Results from Sampling (n = {args.samples}, "
+              f"{args.walkers} walkers, 95% confidence)")
+        for page in sorted(ranks):
+            print(f"  {page}: {ranks[page]:.4f} ± {intervals[page]:.4f}")
+    else:
+        ranks = sample_pagerank(corpus, DAMPING, args.samples, seed=args.seed)
+        print(f"PageRank Results from Sampling (n = {args.samples})")
+        for page in sorted(ranks):
+            print(f"  {page}: {ranks[page]:.4f}")
+    callback = print_sweep if args.verbose else None
+    if args.state:
+        ranks, report = incremental_pagerank(
+            corpus, DAMPING, args.state, tolerance=args.tolerance,
+            norm=args.norm, method=args.method,
+            extrapolation=args.extrapolation, callback=callback
+        )
+        print(f"PageRank Results from Iteration "
+              f"({len(report['added'])} added, "
+              f"{len(report['removed'])} removed, "
+              f"{len(report['changed'])} changed, "
+              f"{report['iterations']} sweeps)")
+    else:
+        ranks = iterate_pagerank(
+            corpus, DAMPING, tolerance=args.tolerance, norm=args.norm,
+            method=args.method, extrapolation=args.extrapolation,
+            callback=callback
+        )
+        print(f"PageRank Results from Iteration")
     for page in sorted(ranks):
         print(f"  {page}: {ranks[page]:.4f}")
+    if topics:
+        for topic, ranks in personalized_pagerank(
+            corpus, DAMPING, topics, tolerance=args.tolerance
+        ).items():
+            print(f"PageRank Results Personalized to {topic}")
+            for page in sorted(ranks):
+                print(f"  {page}: {ranks[page]:.4f}")
+
+
+def print_sweep(iteration, residual, seconds):
+    print(f"  sweep {iteration}: residual {residual:.3e} "
+          f"after {seconds * 1000:.1f}ms")
 
 
 def crawl(directory):
@@ -35,7 +149,7 @@ def crawl(directory):
             continue
         with open(os.path.join(directory, filename)) as f:
             contents = f.read()
-            links = re.findall(r"<a\s+(?:[^>]*?)href=\"([^\"]*)\"", contents)
+            links = LINK.findall(contents)
             pages[filename] = set(links) - {filename}
 
     # Only include links to other pages in the corpus
@@ -48,6 +162,107 @@ def crawl(directory):
     return pages
 
 
+def parallel_crawl(directory, workers=None, info=None):
+    """
+    Parse a directory of HTML pages like `crawl`, reading the pages in
+    chunks in a pool of `workers` processes (one per core by default),
+    and return the links between them as a LinkGraph.
+
+    If `info` is a dictionary, the number of "pages", the "seconds"
+    taken and the "pages_per_second" are stored in it.
+    """
+    start = time.perf_counter()
+    pages = sorted(
+        entry.name for entry in os.scandir(directory)
+        if entry.name.endswith(".html")
+    )
+
+    # pages are handed out in order, so each page's links
+    # come back in the order of the page table
+    with multiprocessing.Pool(workers, _init_crawler, (pages,)) as pool:
+        links = list(pool.imap(
+            _crawl_worker,
+            ((directory, page) for page in pages),
+            chunksize=max(1, len(pages) // (16 * (workers or os.cpu_count())))
+        ))
+    graph = LinkGraph.from_links(pages, links)
+
+    if info is not None:
+        seconds = time.perf_counter() - start
+        info["pages"] = len(pages)
+        info["seconds"] = seconds
+        info["pages_per_second"] = len(pages) / seconds if seconds else 0
+    return graph
+
+
+def _init_crawler(pages):
+    global worker_pages
+    worker_pages = {page: i for i, page in enumerate(pages)}
+
+
+def _crawl_worker(task):
+    """
+    Return the sorted indexes of the other pages in the corpus
+    linked to by one page, reading it a chunk at a time.
+    """
+    directory, page = task
+    links = set()
+    carry = ""
+    with open(os.path.join(directory, page)) as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            text = carry + chunk
+
+            # a tag still open at the end of the text may hold a link
+            # that continues in the next chunk, so it is carried over
+            cut = text.rfind("<")
+            if not chunk or cut == -1 or text.find(">", cut) != -1:
+                cut = len(text)
+            for match in LINK.finditer(text, 0, cut):
+                links.add(match.group(1))
+            carry = text[cut:][-MAX_CARRY:]
+
+            if not chunk:
+                break
+
+    links.discard(page)
+    return np.array(
+        sorted(worker_pages[link] for link in links if link in worker_pages),
+        dtype=np.int32
+    )
+
+
+def load_corpus(directory, cache, workers=None):
+    """
+    Return the link graph of a directory of HTML pages, memory-mapped
+    from the file `cache` if it was saved from the directory as it is
+    now, or else crawled (in `workers` processes) and saved to `cache`.
+    """
+    stamp = corpus_stamp(directory)
+    graph, saved_stamp = LinkGraph.load(cache)
+    if graph is not None and saved_stamp == stamp:
+        return graph
+
+    graph = parallel_crawl(directory, workers)
+    graph.save(cache, stamp)
+    return graph
+
+
+def corpus_stamp(directory):
+    """
+    Return the modification time of a directory, its number of
+    HTML pages and their latest modification time, which change
+    whenever a page is added, removed or edited.
+    """
+    pages = 0
+    latest = 0
+    for entry in os.scandir(directory):
+        if entry.name.endswith(".html"):
+            pages += 1
+            latest = max(latest, entry.stat().st_mtime_ns)
+    return (os.stat(directory).st_mtime_ns, pages, latest)
+
+
 def transition_model(corpus, page, damping_factor):
     """
     Return a probability distribution over which page to visit next,
@@ -77,7 +292,7 @@ def transition_model(corpus, page, damping_factor):
     return probability_distribution
 
 
-def sample_pagerank(corpus, damping_factor, n):
+def sample_pagerank(corpus, damping_factor, n, seed=None):
     """
     Return PageRank values for each page by sampling `n` pages
     according to transition model, starting with a page at random.
@@ -87,39 +302,42 @@ def sample_pagerank(corpus, damping_factor, n):
     PageRank values should sum to 1.
     """
 
-    PageRank = dict()
-
-    # set ranks of all pages to 0
-    for page in corpus:
-        PageRank[page] = 0.0
-
-    # choose the first sample page at random
-    sample = random.choice(list(corpus.keys()))
-    PageRank[sample] += 1
+    # draw each next page in constant time from the link arrays,
+    # which follows the same distribution as transition_model
 
-    # to go to the next page, use the transition model generated by the current page
+    graph = as_link_graph(corpus)
+    rng = np.random.default_rng(seed)
+    counts = sample_counts(graph, damping_factor, n, rng)
 
-    for count in range(1, n):
+    # normalise the ranks
 
-        model = transition_model(corpus, sample, damping_factor)
-        next_page = []
-        probability_next_page = []
+    return graph.ranks_dict(counts / n)
 
-        for page, rank in model.items():
-            next_page.append(page)
-            probability_next_page.append(rank)
+def parallel_sample_pagerank(corpus, damping_factor, n, walkers,
+                             processes=None, seed=None):
+    """
+    Return PageRank values for each page by sampling `n` pages with
+    `walkers` independent random surfers spread over worker processes,
+    along with the half-width of a 95% confidence interval for each
+    value, estimated from the spread between the walkers.
 
-        sample = random.choices(next_page, weights = probability_next_page, k = 1)[0]
-        PageRank[sample] += 1
+    Return two dictionaries keyed by page name: the PageRank values,
+    which sum to 1, and their confidence interval half-widths.
+    """
+    if walkers > n:
+        raise ValueError("there must be at least one sample per walker")
 
-    # normalise the ranks
+    graph = as_link_graph(corpus)
+    counts = parallel_sample_counts(
+        graph, damping_factor, n, walkers, processes=processes, seed=seed
+    )
+    ranks, intervals = confidence_intervals(counts)
 
-    for page in corpus:
-        PageRank[page] = PageRank[page] / n
+    return graph.ranks_dict(ranks), graph.ranks_dict(intervals)
 
-    return PageRank
 
-def iterate_pagerank(corpus, damping_factor):
+def iterate_pagerank(corpus, damping_factor, tolerance=0.001, norm="max",
+                     method="power", extrapolation=None, callback=None):
     """
     Return PageRank values for each page by iteratively updating
     PageRank values until convergence.
@@ -127,47 +345,81 @@ def iterate_pagerank(corpus, damping_factor):
     Return a dictionary where keys are page names, and values are
     their estimated PageRank value (a value between 0 and 1). All
     PageRank values should sum to 1.
-    """
 
-    PageRank = dict()
-    accuracy = 0.001
+    By default, iteration stops once no value changes by more than
+    0.001. `tolerance`, `norm`, `method`, `extrapolation` and
+    `callback` are passed on to `power_iteration`.
+    """
 
-    # initialise the rank of each page with 1 / N
+    # build the link matrix once, then update the ranks of all pages
+    # with vectorized sweeps until they change by less than the tolerance
 
-    N = len(corpus)
+    graph = as_link_graph(corpus)
+    ranks = power_iteration(
+        graph, damping_factor, tolerance=tolerance, norm=norm,
+        method=method, extrapolation=extrapolation, callback=callback
+    )
 
-    for page in corpus:
-        PageRank[page] = 1 / N
+    return graph.ranks_dict(ranks)
 
-    # for each page, use the PageRank formula to calculate the ranks
 
-    while True:
+def incremental_pagerank(corpus, damping_factor, state, tolerance=0.001,
+                         norm="max", method="power", extrapolation=None,
+                         callback=None):
+    """
+    Return PageRank values for each page like `iterate_pagerank`, but
+    starting from the ranks saved in the file `state` by a previous run
+    on an older version of the corpus, if there is one. The new link
+    graph and ranks are then saved to `state` for the next run. The
+    other options are passed on to `power_iteration`.
+
+    Return the dictionary of PageRank values, and a report with the
+    pages "added", "removed" and "changed" since the saved run and the
+    number of "iterations" it took to converge.
+    """
 
-        count = 0
+    graph = as_link_graph(corpus)
+    report = {"added": list(graph.pages), "removed": [], "changed": []}
+    start = None
 
-        for page in corpus:
+    # reuse the previous ranks as the starting point,
+    # so only the effect of the changed pages has to settle
 
-            new_rank = (1 - damping_factor) / N
-            change = 0
+    if os.path.exists(state):
+        old_graph, old_ranks = load_ranks(state)
+        report = diff_graphs(old_graph, graph)
+        start = warm_start(old_graph, old_ranks, graph)
 
-            for new_page in corpus:
+    ranks = power_iteration(
+        graph, damping_factor, tolerance=tolerance, start=start,
+        info=report, norm=norm, method=method, extrapolation=extrapolation,
+        callback=callback
+    )
+    save_ranks(state, graph, ranks)
 
-                if page in corpus[new_page]:
-                    NumLinks = len(corpus[new_page])
-                    change = change + (PageRank[new_page] / NumLinks)
+    return graph.ranks_dict(ranks), report
 
-            change = damping_factor * change
-            new_rank += change
 
-            if abs(PageRank[page] - new_rank) < accuracy:
-                count += 1
+def personalized_pagerank(corpus, damping_factor, topics, tolerance=0.001):
+    """
+    Return personalized PageRank values for every topic in `topics`, a
+    dictionary mapping a topic name to the pages the random surfer
+    jumps to, uniformly, instead of to any page of the corpus.
 
-            PageRank[page] = new_rank
+    Return a dictionary mapping each topic to a dictionary of PageRank
+    values like the one returned by `iterate_pagerank`. All topics are
+    computed together in a single iteration.
+    """
+    graph = as_link_graph(corpus)
+    names = list(topics)
+    teleport = teleport_matrix(graph, [topics[name] for name in names])
+    ranks = personalized_iteration(graph, damping_factor, teleport,
+                                   tolerance=tolerance)
 
-        if count == N:
-            break
+    return {
+        name: graph.ranks_dict(ranks[:, k]) for k, name in enumerate(names)
+    }
 
-    return PageRank
 
 if __name__ == "__main__":
     main()